@@ -0,0 +1,67 @@
+"""
+gunicorn configuration for the production image.
+
+    gunicorn --config gunicorn.conf.py
+
+SERVER_MODE=wsgi (the default) runs threaded sync workers on
+project.wsgi; SERVER_MODE=asgi runs uvicorn workers on project.asgi.
+WEB_CONCURRENCY and GUNICORN_THREADS override the worker and thread
+counts derived from the CPUs available to the container.
+
+The application is imported once in the master (preload_app) and forked,
+so workers share its memory copy-on-write. Workers are recycled after
+roughly max_requests requests, with jitter so they don't all restart at
+once, which bounds the growth of any slow leak.
+"""
+import os
+
+
+def available_cpus():
+    # Honours the container's CPU set, unlike os.cpu_count()
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+cpus = available_cpus()
+
+bind = os.environ.get('GUNICORN_BIND', ':5000')
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'project.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # Each worker multiplexes requests on its event loop
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus + 1))
+else:
+    wsgi_app = 'project.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus * 2 + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+# Use /dev/shm for worker heartbeats; a disk-backed tmp can stall them
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading belong to the master; each worker
+    # must open its own.
+    from django.db import connections
+    connections.close_all()
+
+    # Poll for due retries and stale jobs from the start, not just once a
+    # request has queued a job (users.jobs)
+    from django.conf import settings
+    if settings.JOBS_IN_PROCESS:
+        from users import jobs
+        jobs.start_poller()
@@ -3,6 +3,16 @@ ASGI config for project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with uvicorn workers under gunicorn, e.g.
+
+    gunicorn project.asgi:application -k uvicorn.workers.UvicornWorker --bind :5000
+
+The views are synchronous, so under ASGI Django runs each request in a
+worker thread; WSGI (the image's default) is the faster choice for this
+API. Persistent database connections are off by default: requests reach
+the database from a different thread each time, so connections would pile
+up rather than be reused. Put PgBouncer in front of PostgreSQL instead.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +22,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
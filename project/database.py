@@ -0,0 +1,92 @@
+"""
+Database configuration from the environment.
+
+``DATABASE_URL`` selects the backend, e.g.
+
+    postgres://user:password@db:5432/land_transfer?sslmode=require
+    sqlite:///db.sqlite3            (relative to the project directory)
+    sqlite:////var/lib/app/db.sqlite3
+
+Connection reuse is tuned with ``DB_CONN_MAX_AGE`` (seconds, default 60)
+and ``DB_CONN_HEALTH_CHECKS``. Set ``DATABASE_POOL=pgbouncer`` when
+PostgreSQL is reached through PgBouncer in transaction pooling mode.
+SQLite connections are switched to WAL journaling when they are opened if
+``DB_SQLITE_WAL`` is set (settings.SQLITE_WAL); it is left off in checkouts
+because WAL permanently rewrites the header of the database file.
+"""
+import os
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+ENGINES = {
+    'postgres': 'django.db.backends.postgresql',
+    'postgresql': 'django.db.backends.postgresql',
+    'sqlite': 'django.db.backends.sqlite3',
+}
+
+# Seconds a SQLite connection waits on a locked database before failing
+SQLITE_BUSY_TIMEOUT = 20
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def parse_database_url(url, base_dir):
+    parts = urlsplit(url)
+    if parts.scheme not in ENGINES:
+        raise ValueError(f'Unsupported database URL scheme "{parts.scheme}".')
+
+    config = {'ENGINE': ENGINES[parts.scheme]}
+    options = dict(parse_qsl(parts.query))
+
+    if parts.scheme == 'sqlite':
+        path = unquote(parts.path)
+        # sqlite:///name is relative, sqlite:////abs/name is absolute
+        path = path[1:] if path.startswith('/') else path
+        config['NAME'] = path if os.path.isabs(path) else base_dir / path
+        options['timeout'] = float(options.get('timeout', SQLITE_BUSY_TIMEOUT))
+    else:
+        config.update({
+            'NAME': unquote(parts.path.lstrip('/')),
+            'USER': unquote(parts.username or ''),
+            'PASSWORD': unquote(parts.password or ''),
+            'HOST': parts.hostname or '',
+            'PORT': str(parts.port or ''),
+        })
+
+    if options:
+        config['OPTIONS'] = options
+    return config
+
+
+def database_config(base_dir):
+    """Build ``DATABASES['default']`` from the environment."""
+    url = os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3')
+    config = parse_database_url(url, base_dir)
+    config['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    config['CONN_HEALTH_CHECKS'] = env_flag('DB_CONN_HEALTH_CHECKS', True)
+
+    if os.environ.get('DATABASE_POOL') == 'pgbouncer':
+        # Transaction pooling hands each transaction a different server
+        # connection, so named cursors (used by QuerySet.iterator()) break.
+        config['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return config
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    WAL lets readers proceed while a gunicorn worker writes; the busy
+    timeout itself is passed to sqlite3.connect() via OPTIONS['timeout'].
+    """
+    if connection.vendor == 'sqlite' and settings.SQLITE_WAL:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
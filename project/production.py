@@ -0,0 +1,90 @@
+"""
+Production settings, selected with DJANGO_SETTINGS_MODULE=project.production
+(the image's default, see the Dockerfile).
+
+Everything not overridden here comes from project/settings.py. DEBUG is
+off, so Django no longer keeps every SQL query of a request in memory and
+the browsable API is not offered. Requires:
+
+    DJANGO_SECRET_KEY       the secret key
+    DJANGO_ALLOWED_HOSTS    comma separated host names (default: any)
+    REDIS_URL               the shared cache, e.g. redis://redis:6379/0
+
+and orjson, which the JSON renderer would otherwise silently replace with
+the much slower standard library encoder.
+
+DJANGO_SECURE_COOKIES=0 allows session and CSRF cookies over plain HTTP.
+
+Static files are served by WhiteNoise: compressed, with hashed names and
+far-future cache headers (plain ManifestStaticFilesStorage in checkouts
+without it). Uploaded media is not served by Django outside DEBUG and
+should come from the front proxy.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from project.database import env_flag
+from project.settings import *  # NOQA
+
+DEBUG = False
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',')
+
+# gunicorn runs several worker processes, and the response cache generations
+# and the metrics registry only work if they all see the same cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+}
+
+# Lets readers proceed while another worker writes to a SQLite database
+SQLITE_WAL = env_flag('DB_SQLITE_WAL', True)
+
+# TLS is terminated by the proxy in front of gunicorn
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = env_flag('DJANGO_SECURE_COOKIES', True)
+
+try:
+    import orjson  # NOQA
+except ImportError as exc:  # pragma: no cover - depends on the environment
+    raise ImproperlyConfigured('orjson is required in production, see pyproject.toml') from exc
+
+# settings.py adds the browsable API because its own DEBUG is on
+DEFAULT_RENDERER_CLASSES = tuple(
+    renderer for renderer in DEFAULT_RENDERER_CLASSES
+    if renderer != 'rest_framework.renderers.BrowsableAPIRenderer')
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': DEFAULT_RENDERER_CLASSES,
+}
+
+try:
+    import whitenoise  # NOQA
+except ImportError:  # pragma: no cover - depends on the environment
+    STATICFILES_BACKEND = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+else:
+    MIDDLEWARE = [
+        MIDDLEWARE[0], 'whitenoise.middleware.WhiteNoiseMiddleware', *MIDDLEWARE[1:]]
+    STATICFILES_BACKEND = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': STATICFILES_BACKEND},
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('DJANGO_LOG_LEVEL', 'INFO'),
+    },
+}
@@ -13,6 +13,8 @@ from datetime import timedelta
 import os
 from pathlib import Path
 
+from project.database import database_config, env_flag
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.metrics.RequestMetricsMiddleware',
+    'users.events.EventBatchMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,13 +85,44 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Configured from DATABASE_URL (SQLite at db.sqlite3 by default), see
+# project/database.py
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
 }
 
+# Open SQLite databases in WAL mode (on in project/production.py). Off here
+# because it rewrites the header of the db.sqlite3 checked into the repo.
+SQLITE_WAL = env_flag('DB_SQLITE_WAL')
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Set REDIS_URL to share the cache between workers (project/production.py
+# requires it).
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a cached API response is kept (users.caching)
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Serve transaction, property and party lists from values() rows
+# (users.fastpath) without being asked with ?fast=1
+VALUES_LISTS = env_flag('DJANGO_VALUES_LISTS')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -133,14 +168,37 @@ MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'mediafiles')
 # URL used to access the media
 MEDIA_URL = '/media/'
 
+# Limits for resumable document uploads (/api/uploads/)
+CHUNKED_UPLOAD_MAX_SIZE = 500 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Queries an API request may run before it is logged and counted as over
+# budget, and how often each process publishes its route metrics to the
+# cache (users.metrics, /api/_metrics/)
+QUERY_BUDGET = int(os.environ.get('DJANGO_QUERY_BUDGET', 50))
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+
+# Background jobs (users.jobs). With JOBS_IN_PROCESS each web process runs
+# queued jobs on JOB_WORKERS threads, and polls for due and stale jobs every
+# JOB_POLL_INTERVAL seconds; turn it off when `manage.py run_worker`
+# processes the queue instead. A running job is handed to another worker
+# after JOB_LOCK_TIMEOUT seconds, and finished jobs are deleted after
+# JOB_RETENTION_DAYS.
+JOBS_IN_PROCESS = env_flag('JOBS_IN_PROCESS', True)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = int(os.environ.get('JOB_POLL_INTERVAL', 30))
+JOB_LOCK_TIMEOUT = 600
+JOB_RETENTION_DAYS = 7
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Disable the Browsable HTML API
+# JSON goes through orjson when it is installed (see users.renderers)
 DEFAULT_RENDERER_CLASSES = (
-    'rest_framework.renderers.JSONRenderer',
+    'users.renderers.ORJSONRenderer',
 )
 
 # Only enable the browseable HTML API in dev (DEBUG=True)
@@ -152,11 +210,18 @@ if DEBUG:
 REST_FRAMEWORK = {
     # Disable the Browsable HTML API UI when in production (DEBUG=False)
     'DEFAULT_RENDERER_CLASSES': DEFAULT_RENDERER_CLASSES,
+    'DEFAULT_PARSER_CLASSES': (
+        'users.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 
     # Pagination allows you to control how many objects per page are returned
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'users.pagination.PageNumberOrKeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticated',),
+    # Answers a stale Transaction.save() with 409 Conflict
+    'EXCEPTION_HANDLER': 'users.transitions.exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
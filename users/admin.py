@@ -1,12 +1,11 @@
 import decimal
-import csv
-from django.http import HttpResponse
 from django.contrib import admin
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import UserAdmin
 
+from .exports import InspectionExport, PropertyExport, TransactionExport, stream_export
 from .forms import StaffUserCreationForm, StaffUserChangeForm, PartyUserCreationForm, PartyUserChangeForm
-from .models import Party, Property, Transaction, StaffUser, Inspection, TransactionAssignment, InspectionImage
+from .models import ChunkedUpload, Party, Property, Transaction, StaffUser, Inspection, TransactionAssignment, InspectionImage, WorkItem, WorklistCounter, StatsRollup, Job, TransactionEvent
 
 
 class StaffUserAdmin(UserAdmin):
@@ -63,41 +62,56 @@ class PropertyAdmin(admin.ModelAdmin):
     actions = ['export_property']
 
     def export_property(modeladmin, request, queryset):
+        return stream_export(PropertyExport(queryset), filename='properties')
 
-        # Create a CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="projects.csv"'
+    export_property.short_description = 'Export properties to CSV'
 
-        # Create a CSV writer and write the header row
-        csv_writer = csv.writer(response)
-        csv_writer.writerow(
-            ['Property Identifier', 'Area', 'Locality', 'District' 'Ownership type', 'Property type', 'Created At',])
 
-        # Write data rows for selected projects
-        for obj in queryset:
-            csv_writer.writerow([
-                obj.zupin,
-                obj.area,
-                obj.locality,
-                obj.district,
-                obj.get_ownership_type_display(),
-                obj.get_property_type_display(),
-                obj.created_at,
+class TransactionAdmin(admin.ModelAdmin):
+    actions = ['export_transaction']
 
-            ])
+    def export_transaction(modeladmin, request, queryset):
+        return stream_export(TransactionExport(queryset), filename='transactions')
 
-        return response
+    export_transaction.short_description = 'Export transactions to CSV'
 
-    export_property.short_description = 'Export properties to CSV'
+
+class InspectionAdmin(admin.ModelAdmin):
+    actions = ['export_inspection']
+
+    def export_inspection(modeladmin, request, queryset):
+        return stream_export(InspectionExport(queryset), filename='inspections')
+
+    export_inspection.short_description = 'Export inspections to CSV'
+
+
+class TransactionEventAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'transaction_id', 'action', 'actor')
+    list_filter = ('action',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(StaffUser, StaffUserAdmin)
 admin.site.unregister(Group)
-admin.site.register(Transaction)
+admin.site.register(Transaction, TransactionAdmin)
 admin.site.register(Property, PropertyAdmin)
 admin.site.register(Party, PartyUserAdmin)
 admin.site.register(TransactionAssignment)
-admin.site.register(Inspection)
+admin.site.register(Inspection, InspectionAdmin)
 admin.site.register(InspectionImage)
+admin.site.register(ChunkedUpload)
+admin.site.register(WorkItem)
+admin.site.register(WorklistCounter)
+admin.site.register(StatsRollup)
+admin.site.register(Job)
+admin.site.register(TransactionEvent, TransactionEventAdmin)
 
 # admin.site.register(Ownership)
@@ -0,0 +1,264 @@
+"""
+Benchmarks of the transaction lifecycle through the API.
+
+``seed`` generates transactions with their property and parties through
+the batched intake path (``users.bulk``), a fixed number of queries per
+500 rows. ``LifecycleBenchmark`` then drives the API in process with
+``APIClient`` and, for every scenario, records the latency and number of
+queries of each request plus the peak memory allocated while serving one
+request (traced separately, since tracing slows everything down):
+
+    create      POST a transaction (WriteTransactionSerializer)
+    list        GET a page of transactions, uncached
+    retrieve    GET one transaction, uncached
+    verify      PATCH toggle-verified
+    assign      POST a task assignment
+    inspect     POST an inspection with one image
+
+``QUERY_BUDGETS`` caps the queries per request of each scenario; query
+counts are deterministic, so exceeding one is a regression. See
+``manage.py benchmark`` for running the suite against a scratch database.
+"""
+import datetime
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from users.bulk import bulk_create_transactions
+from users.models import Transaction, TransactionAssignment
+
+SCENARIOS = ('create', 'list', 'retrieve', 'verify', 'assign', 'inspect')
+
+# Writes include the BEGIN, INSERT and COMMIT of their request's events
+QUERY_BUDGETS = {
+    'create': 43,
+    'list': 6,
+    'retrieve': 5,
+    'verify': 17,
+    'assign': 11,
+    'inspect': 15,
+}
+
+DISTRICTS = ('Urban', 'West A', 'West B', 'North A', 'North B', 'Central', 'South',
+             'Wete', 'Micheweni', 'Chake Chake', 'Mkoani')
+SEED_BATCH_SIZE = 500
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def party_row(n, prefix):
+    return {
+        'first_name': 'Seed',
+        'middle_name': '',
+        'last_name': f'Party{n}',
+        'identification': f'{prefix}{n:010d}',
+        'email': f'{prefix.lower()}party{n}@example.com',
+        'phone_number': f'{prefix}{n:010d}',
+        'dob': datetime.date(1970, 1, 1),
+        'gender': 'F' if n % 2 else 'M',
+        'address': 'Stone Town',
+        'citizenship': 'Tanzanian',
+    }
+
+
+def transaction_row(n, prefix, rng):
+    flags = {name: index < rng.randint(0, 4)
+             for index, (_, name) in enumerate(Transaction.STAGE_FLAGS)}
+    return {
+        'type': rng.choice(Transaction.TRANSACTION_TYPE_CHOICES)[0],
+        'form_number': f'{prefix}F{n:08d}',
+        'registration_number': f'{prefix}R{n:08d}',
+        'received_from': 'Registry',
+        'purchase_price': Decimal(rng.randrange(100000, 50000000)) / 100,
+        'property': {
+            'zupin': f'{prefix}Z{n:08d}',
+            'property_type': 'plot',
+            'ownership_type': 'cro',
+            'area': Decimal('120.500'),
+            'locality': 'Mjini',
+            'district': rng.choice(DISTRICTS),
+        },
+        'transferor': [party_row(n * 2, prefix)],
+        'transferee': [party_row(n * 2 + 1, prefix)],
+        **flags,
+    }
+
+
+def seed(transactions, prefix='S', seed=0, created_by_id=None):
+    """Create ``transactions`` transactions; returns their primary keys."""
+    rng = random.Random(seed)
+    pks = []
+    for start in range(0, transactions, SEED_BATCH_SIZE):
+        rows = [(n, transaction_row(n, prefix, rng))
+                for n in range(start, min(start + SEED_BATCH_SIZE, transactions))]
+        for _, instance, errors in bulk_create_transactions(rows, created_by_id):
+            if errors:
+                raise BenchmarkError(errors)
+            pks.append(instance.pk)
+    return pks
+
+
+def percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+@dataclass
+class Result:
+    scenario: str
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    peak_memory: int = 0
+
+    def summary(self):
+        return {
+            'scenario': self.scenario,
+            'requests': len(self.latencies),
+            'p50_ms': round(percentile(self.latencies, 50), 2),
+            'p95_ms': round(percentile(self.latencies, 95), 2),
+            'max_ms': round(max(self.latencies), 2),
+            'queries_mean': round(statistics.mean(self.queries), 1),
+            'queries_max': max(self.queries),
+            'peak_memory_kib': round(self.peak_memory / 1024, 1),
+        }
+
+
+def make_image():
+    stream = BytesIO()
+    Image.new('RGB', (800, 600), (90, 140, 60)).save(stream, 'JPEG')
+    stream.seek(0)
+    stream.name = 'inspection.jpg'
+    return stream
+
+
+class LifecycleBenchmark:
+    """
+    Runs each scenario ``iterations`` times as ``user`` against the
+    ``transactions`` already in the database.
+    """
+
+    def __init__(self, user, transactions, iterations=50, prefix='B'):
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.transactions = list(transactions)
+        self.iterations = iterations
+        self.prefix = prefix
+        self.rng = random.Random(0)
+        self.counter = 0
+
+    def next_number(self):
+        self.counter += 1
+        return self.counter
+
+    def pick(self):
+        return self.rng.choice(self.transactions)
+
+    def request(self, method, path, expected, **kwargs):
+        response = getattr(self.client, method)(path, **kwargs)
+        if response.status_code != expected:
+            raise BenchmarkError(
+                f'{method.upper()} {path} answered {response.status_code}: '
+                f'{response.content[:300]!r}')
+        return response
+
+    # Scenarios. Each prepares one request and returns a callable sending
+    # it, so that only the request itself is timed and counted.
+
+    def create(self):
+        row = transaction_row(self.next_number(), self.prefix, self.rng)
+        row = {name: value for name, value in row.items() if not name.startswith('is_')}
+
+        def send():
+            response = self.request('post', '/api/transactions/', 201, data=row, format='json')
+            self.transactions.append(response.data['id'])
+        return send
+
+    def list(self):
+        cache.clear()
+        return lambda: self.request('get', '/api/transactions/', 200)
+
+    def retrieve(self):
+        cache.clear()
+        return lambda: self.request('get', f'/api/transactions/{self.pick()}/', 200)
+
+    def verify(self):
+        path = f'/api/transactions/{self.pick()}/toggle-verified/'
+        data = {'is_verified': self.rng.random() < 0.5}
+        return lambda: self.request('patch', path, 200, data=data, format='json')
+
+    def assign(self):
+        data = {'transaction': str(self.pick())}
+        return lambda: self.request('post', '/api/task_assignments/', 201, data=data, format='json')
+
+    def inspect(self):
+        transaction = self.pick()
+        assignment = TransactionAssignment.objects.filter(
+            transaction_id=transaction).values_list('pk', flat=True).first()
+        if assignment is None:
+            assignment = TransactionAssignment.objects.create(transaction_id=transaction).pk
+        data = {
+            'transaction_assigned': assignment,
+            'description': 'Site visit',
+            'images': [make_image()],
+        }
+        return lambda: self.request('post', '/api/inspections/', 201, data=data, format='multipart')
+
+    def run_scenario(self, scenario):
+        prepare = getattr(self, scenario)
+        result = Result(scenario)
+        for _ in range(self.iterations):
+            send = prepare()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                send()
+                elapsed = time.perf_counter() - started
+            result.latencies.append(elapsed * 1000)
+            result.queries.append(len(queries))
+
+        send = prepare()
+        tracemalloc.start()
+        try:
+            send()
+            result.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result
+
+    def run(self, scenarios=SCENARIOS):
+        return [self.run_scenario(scenario) for scenario in scenarios]
+
+
+def over_budget(results):
+    """Messages for the scenarios whose queries exceeded ``QUERY_BUDGETS``."""
+    return [
+        f'{result.scenario}: {max(result.queries)} queries per request, '
+        f'budget {QUERY_BUDGETS[result.scenario]}'
+        for result in results
+        if max(result.queries) > QUERY_BUDGETS[result.scenario]
+    ]
+
+
+def format_report(results):
+    columns = ('scenario', 'requests', 'p50_ms', 'p95_ms', 'max_ms',
+               'queries_mean', 'queries_max', 'peak_memory_kib')
+    rows = [columns] + [
+        tuple(str(summary[column]) for column in columns)
+        for summary in (result.summary() for result in results)
+    ]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    return '\n'.join(
+        '  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+        for row in rows)
@@ -0,0 +1,241 @@
+"""
+Batched intake of transactions.
+
+``WriteTransactionSerializer.create`` resolves the property and every party
+with its own ``get_or_create`` round trip. When registry staff back-load
+paper files that cost dominates, so the bulk endpoint validates rows in
+memory and then writes them with a fixed number of queries per batch.
+"""
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from users import events, stats
+from users.caching import bump_generation
+from users.models import CustomUser, Party, Property, Transaction
+
+
+# Fields a party row must agree on with the existing party it resolves to
+MATCHED_FIELDS = ('first_name', 'middle_name', 'last_name', 'identification', 'email', 'phone_number')
+
+
+def _party_key(data):
+    return data['identification'], data['email']
+
+
+def _resolve_parties(party_rows):
+    """
+    Map every party key to a saved ``Party``, creating the missing ones.
+
+    Existing parties are found with a single ``IN`` query on identification
+    or email. Returns ``(parties, conflicts)`` where ``conflicts`` maps keys
+    to an error message: the key's email or phone number belongs to another
+    user, or its names or contact details differ from the party it matches.
+    """
+    identifications = {data['identification'] for data in party_rows}
+    emails = {data['email'] for data in party_rows}
+    phones = {data['phone_number'] for data in party_rows}
+
+    by_identification = {}
+    by_email = {}
+    taken_phones = {}
+    taken_emails = {}
+    existing = {}
+    candidates = CustomUser.objects.filter(
+        Q(email__in=emails) | Q(phone_number__in=phones)
+        | Q(party__identification__in=identifications)
+    ).values('id', *[
+        f'party__{name}' if name == 'identification' else name for name in MATCHED_FIELDS])
+    for row in candidates:
+        pk = row['id']
+        identification = row['party__identification']
+        taken_phones[row['phone_number']] = pk
+        taken_emails[row['email']] = pk
+        if identification is not None:
+            by_identification.setdefault(identification, pk)
+            by_email[row['email']] = pk
+            existing[pk] = {**row, 'identification': identification}
+
+    parties = {}
+    conflicts = {}
+    pending = {}
+    for data in party_rows:
+        key = _party_key(data)
+        if key in parties or key in conflicts or key in pending:
+            continue
+        pk = by_identification.get(data['identification']) or by_email.get(data['email'])
+        if pk is not None:
+            differing = [name for name in MATCHED_FIELDS
+                         if name in data and data[name] != existing[pk][name]]
+            if differing:
+                conflicts[key] = (f"Party {data['identification']} matches an existing party "
+                                  f"with a different {', '.join(differing)}.")
+            else:
+                parties[key] = pk
+        elif data['email'] in taken_emails:
+            conflicts[key] = f"A user with email {data['email']} already exists."
+        elif data['phone_number'] in taken_phones:
+            conflicts[key] = f"A user with phone number {data['phone_number']} already exists."
+        else:
+            taken_emails[data['email']] = None
+            taken_phones[data['phone_number']] = None
+            pending[key] = Party(**data)
+
+    if pending:
+        parents = CustomUser.objects.bulk_create([
+            CustomUser(**{
+                field.attname: getattr(party, field.attname)
+                for field in CustomUser._meta.concrete_fields if not field.primary_key
+            })
+            for party in pending.values()
+        ])
+        if any(parent.pk is None for parent in parents):
+            # Only PostgreSQL and SQLite >= 3.35 return the new ids
+            ids = dict(CustomUser.objects.filter(
+                email__in=[parent.email for parent in parents]).values_list('email', 'pk'))
+            for parent in parents:
+                parent.pk = ids[parent.email]
+        for party, parent in zip(pending.values(), parents):
+            party.pk = party.id = parent.pk
+        _insert_child_rows(Party, list(pending.values()))
+        for key, party in pending.items():
+            parties[key] = party.pk
+
+    return parties, conflicts
+
+
+def _insert_child_rows(model, instances):
+    """
+    Insert the rows of ``model``'s own table for ``instances`` whose parent
+    rows already exist. ``bulk_create()`` refuses multi-table inherited
+    models, so this writes multi-row ``INSERT`` statements using only the
+    public field and connection APIs.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    fields = model._meta.local_concrete_fields
+    batch_size = connection.ops.bulk_batch_size(fields, instances) or len(instances)
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        for start in range(0, len(instances), batch_size):
+            batch = instances[start:start + batch_size]
+            params = [field.get_db_prep_save(getattr(instance, field.attname), connection)
+                      for instance in batch for field in fields]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([placeholder] * len(batch))}',
+                params)
+    for instance in instances:
+        instance._state.adding = False
+        instance._state.db = using
+
+
+def _resolve_properties(property_rows):
+    """
+    Return one ``Property`` per row, reusing an unattached property whose
+    fields all match (as ``get_or_create`` would) and bulk creating the rest.
+    """
+    zupins = {data.get('zupin', '') for data in property_rows}
+    free = {}
+    for instance in Property.objects.filter(zupin__in=zupins, transaction__isnull=True):
+        free.setdefault(instance.zupin, []).append(instance)
+
+    properties = []
+    missing = []
+    for data in property_rows:
+        match = None
+        for candidate in free.get(data.get('zupin', ''), []):
+            if all(getattr(candidate, name) == value for name, value in data.items()):
+                match = candidate
+                break
+        if match is not None:
+            free[match.zupin].remove(match)
+        else:
+            match = Property(**data)
+            missing.append(match)
+        properties.append(match)
+
+    Property.objects.bulk_create(missing)
+    return properties
+
+
+def bulk_create_transactions(rows, created_by_id=None):
+    """
+    Create transactions from already validated ``BulkTransactionSerializer``
+    data. Returns a list of ``(index, transaction_or_None, errors)`` in input
+    order; rows with errors are skipped and the rest are written atomically.
+    """
+    results = {}
+    form_numbers = {row['form_number'] for _, row in rows}
+    registration_numbers = {row['registration_number'] for _, row in rows}
+    taken = Transaction.objects.filter(
+        Q(form_number__in=form_numbers) | Q(registration_number__in=registration_numbers)
+    ).values_list('form_number', 'registration_number')
+    taken_forms = {form for form, _ in taken}
+    taken_registrations = {registration for _, registration in taken}
+
+    accepted = []
+    for index, row in rows:
+        errors = {}
+        if row['form_number'] in taken_forms:
+            errors['form_number'] = ['transaction with this form number already exists.']
+        if row['registration_number'] in taken_registrations:
+            errors['registration_number'] = [
+                'transaction with this registration number already exists.']
+        if errors:
+            results[index] = (None, errors)
+            continue
+        taken_forms.add(row['form_number'])
+        taken_registrations.add(row['registration_number'])
+        accepted.append((index, row))
+
+    with transaction.atomic():
+        party_rows = [
+            party for _, row in accepted for party in row['transferor'] + row['transferee']]
+        parties, conflicts = _resolve_parties(party_rows) if party_rows else ({}, {})
+
+        valid = []
+        for index, row in accepted:
+            errors = [
+                conflicts[_party_key(party)] for party in row['transferor'] + row['transferee']
+                if _party_key(party) in conflicts]
+            if errors:
+                results[index] = (None, {'parties': errors})
+            else:
+                valid.append((index, row))
+
+        properties = _resolve_properties([row['property'] for _, row in valid])
+
+        transactions = []
+        transferors = []
+        transferees = []
+        for (index, row), property_instance in zip(valid, properties):
+            fields = {
+                name: value for name, value in row.items()
+                if name not in ('property', 'transferor', 'transferee')}
+            instance = Transaction(
+                property=property_instance, created_by_id=created_by_id, **fields)
+            instance.stage = instance.get_stage()
+            transactions.append(instance)
+            results[index] = (instance, None)
+            for party_id in dict.fromkeys(parties[_party_key(party)] for party in row['transferor']):
+                transferors.append(Transaction.transferor.through(
+                    transaction_id=instance.pk, party_id=party_id))
+            for party_id in dict.fromkeys(parties[_party_key(party)] for party in row['transferee']):
+                transferees.append(Transaction.transferee.through(
+                    transaction_id=instance.pk, party_id=party_id))
+
+        Transaction.objects.bulk_create(transactions)
+        Transaction.transferor.through.objects.bulk_create(transferors)
+        Transaction.transferee.through.objects.bulk_create(transferees)
+        # bulk_create() sends no signals, so count and log the new rows here
+        if transactions:
+            stats.add_transactions([instance.pk for instance in transactions])
+            events.record_many([
+                events.created_event(instance, actor_id=created_by_id) for instance in transactions])
+
+    # Likewise invalidate cached responses.
+    if transactions:
+        bump_generation(Transaction, Property, Party)
+
+    return [(index,) + results[index] for index in sorted(results)]
@@ -0,0 +1,190 @@
+"""
+Read-through caching of API responses.
+
+Every cached model has a generation counter in the shared cache. Signals
+bump the counter, once the transaction commits, whenever a row of that
+model (or one of its M2M links) changes, and cache keys embed the current
+generation of every model a response depends on. Invalidation is therefore a single ``incr`` and
+entries for older generations are simply never read again. A missing
+counter (never set, flushed or evicted) starts again from the clock, so
+it never returns to a generation that older entries were cached under.
+
+``ConditionalGetMixin`` sits in front of that cache and answers
+``If-None-Match`` / ``If-Modified-Since`` from ``updated_at``, the same
+generations, and the time each generation was last bumped.
+"""
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def generation_key(model):
+    return f'generation:{model._meta.label_lower}'
+
+
+def modified_key(model):
+    return f'modified:{model._meta.label_lower}'
+
+
+def get_generations(models):
+    keys = [generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            seed = time.time_ns()
+            cache.add(key, seed, timeout=None)
+            generations[key] = cache.get(key, seed)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(*models):
+    """
+    Invalidate responses depending on ``models`` once the current
+    transaction commits. Bumping earlier would let a concurrent request
+    cache the uncommitted state's predecessor under the new generation.
+    """
+    def bump():
+        for model in models:
+            key = generation_key(model)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), timeout=None)
+            cache.set(modified_key(model), time.time(), timeout=None)
+    transaction.on_commit(bump)
+
+
+def get_last_bumped(models):
+    """When the generation of any of ``models`` was last bumped, or ``None``."""
+    stamps = cache.get_many([modified_key(model) for model in models]).values()
+    if not stamps:
+        return None
+    return datetime.datetime.fromtimestamp(max(stamps), tz=datetime.timezone.utc)
+
+
+class CachedResponseMixin:
+    """
+    Caches successful ``list`` and ``retrieve`` responses, keyed by the
+    full request path, the caller's scope and the generations of
+    ``cache_models``. Authentication and ``has_permission`` still run on
+    every request; object level permissions are not re-checked on a hit.
+    """
+    cache_models = ()
+    cache_timeout = None
+
+    def get_cache_scope(self, request):
+        # Staff all see the same data; anyone else gets their own entries.
+        user = request.user
+        return 'staff' if user.is_staff else f'user:{user.pk}'
+
+    def get_response_cache_key(self, request):
+        generations = get_generations(self.cache_models)
+        raw = '|'.join([
+            self.basename or type(self).__name__,
+            self.action,
+            request.get_host(),
+            request.get_full_path(),
+            request.accepted_media_type or '',
+            self.get_cache_scope(request),
+            *map(str, generations),
+        ])
+        return 'response:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.cache_timeout or getattr(
+                settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators for ``list`` and ``retrieve`` derived
+    from the ``updated_at`` column, so a revalidating client gets a 304
+    after one indexed query and nothing is loaded or serialized. A list's
+    validator is ``MAX(updated_at)`` and ``COUNT(*)`` of the filtered
+    queryset. Both validators also fold in the generations of
+    ``cache_models``, since deletes and cascades don't move ``updated_at``.
+    """
+    modified_field = 'updated_at'
+    cache_models = ()
+
+    def get_etag(self, request, *parts):
+        raw = '|'.join([
+            self.basename or type(self).__name__,
+            request.get_full_path(),
+            request.accepted_media_type or '',
+            *map(str, parts),
+            *map(str, get_generations(self.cache_models)),
+        ])
+        return '"{}"'.format(hashlib.sha1(raw.encode()).hexdigest())
+
+    def get_last_modified(self, last_modified):
+        bumped = get_last_bumped(self.cache_models)
+        if bumped is None or last_modified is None:
+            return last_modified or bumped
+        return max(last_modified, bumped)
+
+    def conditional_response(self, handler, request, etag, last_modified, *args, **kwargs):
+        last_modified = self.get_last_modified(last_modified)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        not_modified = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        stats = queryset.aggregate(
+            last_modified=Max(self.modified_field), count=Count('pk'))
+        etag = self.get_etag(request, stats['last_modified'], stats['count'])
+        return self.conditional_response(
+            super().list, request, etag, stats['last_modified'], *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            queryset = queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            # e.g. a malformed UUID; retrieve() answers 404 for it
+            queryset = queryset.none()
+        rows = queryset.order_by().values_list(self.modified_field, flat=True)[:1]
+        last_modified = next(iter(rows), None)
+        if last_modified is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = self.get_etag(request, kwargs[lookup_url_kwarg], last_modified)
+        return self.conditional_response(
+            super().retrieve, request, etag, last_modified, *args, **kwargs)
@@ -0,0 +1,101 @@
+"""
+Cached lookups of ``Dictionary`` reference data.
+
+Each dictionary is loaded once into an immutable tree of its items (nested
+through ``dictionary_item_parent``) and cached both in process and in the
+shared Django cache. A single version counter, bumped whenever a dictionary
+or item is saved or deleted, is part of every cache key, so invalidation
+is one ``incr`` and stale trees simply stop being read.
+"""
+import time
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+
+from users.models import Dictionary, DictionaryItem
+
+VERSION_KEY = 'dictionaries:version'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+# code -> (version, tree), valid for as long as the shared version matches
+_local = {}
+
+
+@dataclass(frozen=True)
+class DictionaryNode:
+    code: str
+    name_en: str
+    name_sw: str
+    children: tuple = field(default=())
+
+    def to_dict(self):
+        return {
+            'code': self.code,
+            'name_en': self.name_en,
+            'name_sw': self.name_sw,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1 so a flushed shared cache can't
+        # hand out a version some process still holds a local tree for.
+        cache.add(VERSION_KEY, int(time.time()), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time()), timeout=None)
+    _local.clear()
+
+
+def build_tree(code):
+    """Load one dictionary and its items from the database, or ``None``."""
+    dictionary = Dictionary.objects.filter(
+        dictionary_code=code).order_by('id').first()
+    if dictionary is None:
+        return None
+
+    items = list(DictionaryItem.objects.filter(dictionary=dictionary).order_by('id').values_list(
+        'id', 'dictionary_item_code', 'dictionary_item_name_en',
+        'dictionary_item_name_sw', 'dictionary_item_parent'))
+    ids = {item[0] for item in items}
+    children = {}
+    for item in items:
+        parent = item[4] if item[4] in ids else None
+        children.setdefault(parent, []).append(item)
+
+    def nodes(parent, seen=frozenset()):
+        return tuple(
+            DictionaryNode(item_code or '', name_en or '', name_sw or '',
+                           nodes(pk, seen | {pk}))
+            for pk, item_code, name_en, name_sw, _ in children.get(parent, [])
+            if pk not in seen
+        )
+
+    return DictionaryNode(
+        dictionary.dictionary_code, dictionary.dictionary_name_en,
+        dictionary.dictionary_name_sw, nodes(None))
+
+
+def get_dictionary(code):
+    """Return ``(version, tree)`` for ``code``; ``tree`` is ``None`` if unknown."""
+    version = get_version()
+    cached = _local.get(code)
+    if cached is not None and cached[0] == version:
+        return cached
+
+    key = f'dictionaries:{version}:{code}'
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_tree(code)
+        if tree is not None:
+            cache.set(key, tree, CACHE_TIMEOUT)
+    _local[code] = (version, tree)
+    return version, tree
@@ -0,0 +1,163 @@
+"""
+The audit trail of transactions: stage changes, assignments and
+inspections as append-only ``TransactionEvent`` rows.
+
+Code that changes a transaction calls ``record()``. An event is kept only
+if the database transaction around the change commits. While a
+``batch()`` is open, and ``EventBatchMiddleware`` opens one per API
+request and ``users.jobs`` one per job, committed events are buffered
+and written with a single INSERT when it closes. Events recorded in it
+without an actor are attributed to the batch's authenticated user.
+
+Rows are never updated. ``timeline()`` is an index range scan on
+``(transaction, created_at)``. ``created_at`` is stamped when an event is
+recorded but the row is inserted when its batch is written, so it does not
+grow with insertion order; ``scan()`` therefore walks the autoincrement
+``id`` in keyset chunks, filtering on ``created_at``, rather than holding a
+cursor open.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from users.models import Transaction, TransactionEvent
+
+CHUNK_SIZE = 2000
+
+FLAGS = tuple(flag for _, flag in Transaction.STAGE_FLAGS)
+
+_batch = ContextVar('transaction_events', default=None)
+
+
+class Batch:
+    def __init__(self, request=None):
+        self.request = request
+        self.events = []
+
+    def get_actor(self):
+        # DRF sets the user it authenticated on the underlying request
+        user = getattr(self.request, 'user', None)
+        return user if user is not None and user.is_authenticated else None
+
+    def attribute(self, events):
+        if any(event.actor_id is None for event in events):
+            actor = self.get_actor()
+            for event in events:
+                if event.actor_id is None:
+                    event.actor = actor
+
+    def flush(self):
+        events, self.events = self.events, []
+        if events:
+            TransactionEvent.objects.bulk_create(events)
+
+
+@contextmanager
+def batch(request=None):
+    """Buffer the events committed inside the block and write them at its end."""
+    current = _batch.get()
+    if current is not None:
+        yield current
+        return
+    current = Batch(request)
+    token = _batch.set(current)
+    try:
+        yield current
+    finally:
+        _batch.reset(token)
+        current.flush()
+
+
+def add(events):
+    current = _batch.get()
+    if current is None:
+        TransactionEvent.objects.bulk_create(events)
+    else:
+        current.events.extend(events)
+
+
+def record_many(events):
+    """Keep the unsaved ``events`` once the current transaction commits."""
+    if not events:
+        return
+    current = _batch.get()
+    if current is not None:
+        current.attribute(events)
+    db_transaction.on_commit(lambda: add(events))
+
+
+def record(transaction_id, action, changes=None, actor=None):
+    record_many([TransactionEvent(
+        transaction_id=transaction_id, action=action, changes=changes or {},
+        actor=actor, created_at=timezone.now())])
+
+
+def created_event(transaction, **kwargs):
+    return TransactionEvent(
+        transaction_id=transaction.pk, action='created', changes={'stage': [None, transaction.stage]},
+        created_at=timezone.now(), **kwargs)
+
+
+def flag_changes(before, after):
+    """``{field: [old, new]}`` for the flags and stage differing between two rows."""
+    return {name: [before[name], after[name]] for name in (*FLAGS, 'stage')
+            if name in before and name in after and before[name] != after[name]}
+
+
+def timeline(transaction_id):
+    return TransactionEvent.objects.filter(transaction_id=transaction_id).order_by('created_at', 'pk')
+
+
+def scan(since, until=None, actions=None, chunk_size=CHUNK_SIZE):
+    """Yield event rows created in ``[since, until)`` in insertion order, chunk by chunk."""
+    queryset = TransactionEvent.objects.filter(created_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=until)
+    if actions:
+        queryset = queryset.filter(action__in=actions)
+    queryset = queryset.order_by('pk').values(
+        'id', 'transaction_id', 'action', 'changes', 'actor_id', 'created_at')
+
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]['id']
+
+
+class EventBatchMiddleware:
+    """Writes the events of each API request with one INSERT, see ``batch()``."""
+    sync_capable = True
+    async_capable = True
+    path_prefix = '/api/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not request.path.startswith(self.path_prefix):
+            return self.get_response(request)
+        with batch(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not request.path.startswith(self.path_prefix):
+            return await self.get_response(request)
+        current = Batch(request)
+        token = _batch.set(current)
+        try:
+            return await self.get_response(request)
+        finally:
+            _batch.reset(token)
+            if current.events:
+                await sync_to_async(current.flush)()
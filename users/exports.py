@@ -0,0 +1,214 @@
+"""
+Streaming CSV / NDJSON exports.
+
+Rows are read with ``values_list().iterator()`` and written to the response
+as they are produced, so memory stays flat however many rows are exported.
+Used by the admin export actions and by ``ExportView``.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from users.models import Inspection, Property, Transaction
+
+CHUNK_SIZE = 2000
+
+TRANSACTION_FLAGS = tuple(flag for _, flag in Transaction.STAGE_FLAGS)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """A file-like object whose write() hands the value straight back."""
+
+    def write(self, value):
+        return value
+
+
+def _display(model, field_name):
+    choices = dict(model._meta.get_field(field_name).choices)
+    return lambda value: choices.get(value, value)
+
+
+class Export:
+    """
+    Describes one exportable model: the queryset, the ``(header, lookup,
+    transform)`` columns and the lookups used by ``filter()``.
+    """
+    model = None
+    columns = ()
+    district_lookup = None
+    created_lookup = 'created_at'
+    flags = ()
+    choices = ()
+
+    def __init__(self, queryset=None):
+        self.queryset = self.model.objects.all() if queryset is None else queryset
+
+    @property
+    def headers(self):
+        return [header for header, _, _ in self.columns]
+
+    def filter(self, params):
+        """Narrow the queryset with district, date range and flag filters."""
+        queryset = self.queryset
+        district = params.get('district')
+        if district:
+            queryset = queryset.filter(**{self.district_lookup: district})
+        created_from = parse_date(params.get('created_from') or '')
+        if created_from:
+            queryset = queryset.filter(
+                **{f'{self.created_lookup}__date__gte': created_from})
+        created_to = parse_date(params.get('created_to') or '')
+        if created_to:
+            queryset = queryset.filter(
+                **{f'{self.created_lookup}__date__lte': created_to})
+        for flag in self.flags:
+            value = params.get(flag)
+            if value in ('true', 'false'):
+                queryset = queryset.filter(**{flag: value == 'true'})
+        for name in self.choices:
+            value = params.get(name)
+            if value:
+                queryset = queryset.filter(**{name: value})
+        self.queryset = queryset
+        return self
+
+    def chunks(self):
+        lookups = [lookup for _, lookup, _ in self.columns]
+        rows = self.queryset.values_list(*lookups).iterator(chunk_size=CHUNK_SIZE)
+        while True:
+            chunk = list(islice(rows, CHUNK_SIZE))
+            if not chunk:
+                return
+            yield chunk
+
+    def format_row(self, row):
+        return [
+            transform(value) if transform else value
+            for (_, _, transform), value in zip(self.columns, row)
+        ]
+
+    def rows(self):
+        for chunk in self.chunks():
+            for row in chunk:
+                yield self.format_row(row)
+
+
+class PropertyExport(Export):
+    model = Property
+    columns = (
+        ('Property Identifier', 'zupin', None),
+        ('Area', 'area', None),
+        ('Locality', 'locality', None),
+        ('District', 'district', None),
+        ('Ownership type', 'ownership_type', _display(Property, 'ownership_type')),
+        ('Property type', 'property_type', _display(Property, 'property_type')),
+        ('Created At', 'created_at', None),
+    )
+    district_lookup = 'district'
+
+
+class TransactionExport(Export):
+    model = Transaction
+    columns = (
+        ('Id', 'id', None),
+        ('Form Number', 'form_number', None),
+        ('Registration Number', 'registration_number', None),
+        ('Type', 'type', _display(Transaction, 'type')),
+        ('Property Identifier', 'property__zupin', None),
+        ('District', 'property__district', None),
+        ('Locality', 'property__locality', None),
+        ('Purchase Price', 'purchase_price', None),
+        ('Received From', 'received_from', None),
+        ('Stage', 'stage', _display(Transaction, 'stage')),
+    ) + tuple(
+        (Transaction._meta.get_field(flag).verbose_name.capitalize(), flag, None)
+        for flag in TRANSACTION_FLAGS
+    ) + (
+        ('Created At', 'created_at', None),
+    )
+    district_lookup = 'property__district'
+    flags = TRANSACTION_FLAGS
+    choices = ('stage',)
+
+    @property
+    def headers(self):
+        return super().headers + ['Transferors', 'Transferees']
+
+    def _party_names(self, relation, transaction_ids):
+        through = getattr(Transaction, relation).through
+        names = {}
+        pairs = through.objects.filter(transaction_id__in=transaction_ids).values_list(
+            'transaction_id', 'party__first_name', 'party__last_name')
+        for transaction_id, first_name, last_name in pairs:
+            names.setdefault(transaction_id, []).append(
+                f'{first_name} {last_name}')
+        return names
+
+    def rows(self):
+        # Parties are M2M, so they are looked up once per chunk and joined
+        # into a single cell instead of multiplying the transaction rows.
+        for chunk in self.chunks():
+            ids = [row[0] for row in chunk]
+            transferors = self._party_names('transferor', ids)
+            transferees = self._party_names('transferee', ids)
+            for row in chunk:
+                yield self.format_row(row) + [
+                    '; '.join(transferors.get(row[0], [])),
+                    '; '.join(transferees.get(row[0], [])),
+                ]
+
+
+class InspectionExport(Export):
+    model = Inspection
+    columns = (
+        ('Form Number', 'transaction_assigned__transaction__form_number', None),
+        ('Registration Number',
+         'transaction_assigned__transaction__registration_number', None),
+        ('District', 'transaction_assigned__transaction__property__district', None),
+        ('Description', 'description', None),
+        ('Inspected Date', 'inspected_date', None),
+        ('Inspected By', 'inspected_by__email', None),
+        ('Closed', 'closed', None),
+        ('Created At', 'created_at', None),
+    )
+    district_lookup = 'transaction_assigned__transaction__property__district'
+    flags = ('closed',)
+
+
+EXPORTS = {
+    'properties': PropertyExport,
+    'transactions': TransactionExport,
+    'inspections': InspectionExport,
+}
+
+
+def _csv_lines(export):
+    writer = csv.writer(Echo())
+    yield writer.writerow(export.headers)
+    for row in export.rows():
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(export):
+    headers = export.headers
+    for row in export.rows():
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_export(export, file_format='csv', filename=None):
+    """Return a ``StreamingHttpResponse`` that writes ``export`` lazily."""
+    lines = _csv_lines(export) if file_format == 'csv' else _ndjson_lines(export)
+    response = StreamingHttpResponse(
+        lines, content_type=CONTENT_TYPES[file_format])
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
@@ -0,0 +1,208 @@
+"""
+Serialization of read-only lists straight from ``values()`` rows.
+
+``ValuesPlan`` is compiled once per request from a (possibly narrowed)
+ModelSerializer instance: every field becomes a column of a single
+``values()`` query plus a converter taken from the serializer's own field,
+nested foreign keys are joined into the same row and many-valued relations
+are loaded with one ``values()`` query each. Rows are then turned into
+plain dicts without instantiating a serializer or model per row, and the
+output is identical to ``serializer.data``.
+
+Fields the plan cannot read from columns (method fields, dotted sources,
+hyperlinks) raise ``UnsupportedField`` so callers can fall back to the
+serializer.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import relations, serializers
+from rest_framework.settings import api_settings
+
+from users.metrics import serializing
+
+# DRF fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.ReadOnlyField,
+)
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+def _identity(value):
+    return value
+
+
+def file_converter(field, model_field):
+    storage = model_field.storage
+    request = field.context.get('request')
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+
+    def convert(name):
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
+
+
+def converter(field, model_field):
+    if isinstance(field, serializers.FileField):
+        return file_converter(field, model_field)
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        return field.pk_field.to_representation if field.pk_field else _identity
+    if isinstance(field, PASSTHROUGH_FIELDS) and not isinstance(field, serializers.MultipleChoiceField):
+        return _identity
+    if isinstance(field, relations.RelatedField):
+        raise UnsupportedField(field.field_name)
+    return field.to_representation
+
+
+# How ValuesPlan.represent reads each field from a row
+VALUE, NESTED, MANY = range(3)
+
+
+def values_queryset(queryset, plan):
+    """``queryset`` as the ``values()`` rows ``plan`` reads."""
+    # Keyset pagination builds its cursors from the ordering columns
+    ordering = [name.lstrip('-') for name in queryset.query.order_by
+                or queryset.model._meta.ordering]
+    return queryset.prefetch_related(None).values(
+        *dict.fromkeys([*plan.columns, *ordering]))
+
+
+class ValuesPlan:
+    """
+    Columns and converters for one serializer. ``prefix`` is the lookup
+    path from the queried model to this serializer's model.
+    """
+
+    def __init__(self, serializer, prefix=''):
+        self.model = serializer.Meta.model
+        self.pk_column = prefix + 'pk'
+        self.columns = [self.pk_column]
+        self.fields = []
+        self.nested = []
+        self.many = []
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                self.add(name, field, prefix)
+
+    def add(self, name, field, prefix):
+        if field.source == '*' or '.' in field.source:
+            raise UnsupportedField(name)
+        try:
+            model_field = self.model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise UnsupportedField(name)
+
+        if model_field.many_to_many or model_field.one_to_many:
+            relation = ManyRelation(model_field, field)
+            self.many.append(relation)
+            self.fields.append((name, MANY, self.pk_column, relation.get))
+        elif isinstance(field, serializers.BaseSerializer):
+            if isinstance(field, serializers.ListSerializer) or not model_field.is_relation:
+                raise UnsupportedField(name)
+            plan = ValuesPlan(field, f'{prefix}{model_field.name}__')
+            self.nested.append(plan)
+            self.columns.extend(plan.columns)
+            self.fields.append((name, NESTED, plan.pk_column, plan.represent))
+        elif model_field.concrete:
+            column = prefix + model_field.name
+            self.columns.append(column)
+            self.fields.append(
+                (name, VALUE, column, converter(field, model_field)))
+        else:
+            raise UnsupportedField(name)
+
+    def load(self, rows):
+        """Run one query per many-valued relation for all ``rows``."""
+        pks = {row[self.pk_column] for row in rows}
+        pks.discard(None)
+        for relation in self.many:
+            relation.load(pks)
+        for plan in self.nested:
+            plan.load(rows)
+
+    def represent(self, row):
+        data = {}
+        for name, kind, column, convert in self.fields:
+            value = row[column]
+            if kind == VALUE:
+                data[name] = None if value is None else convert(value)
+            elif kind == NESTED:
+                # The nested plan reads its columns from the same row
+                data[name] = None if value is None else convert(row)
+            else:
+                data[name] = convert(value)
+        return data
+
+    def represent_many(self, rows):
+        with serializing():
+            rows = list(rows)
+            self.load(rows)
+            return [self.represent(row) for row in rows]
+
+
+class ManyRelation:
+    """
+    A many-to-many or reverse foreign key field, loaded for a whole page
+    of parents with one query ordered like the related model's manager.
+    """
+
+    def __init__(self, model_field, field):
+        if isinstance(model_field, models.ManyToManyField):
+            self.queryset = model_field.remote_field.through._default_manager.all()
+            self.key = model_field.m2m_column_name()
+            self.lookup = model_field.m2m_field_name()
+            prefix = model_field.m2m_reverse_field_name() + '__'
+        elif model_field.one_to_many:
+            self.queryset = model_field.related_model._default_manager.all()
+            self.key = model_field.field.attname
+            self.lookup = model_field.field.name
+            prefix = ''
+        else:
+            raise UnsupportedField(field.field_name)
+
+        ordering = model_field.related_model._meta.ordering
+        if not all(isinstance(name, str) for name in ordering):
+            raise UnsupportedField(field.field_name)
+        self.ordering = [
+            '-' + prefix + name[1:] if name.startswith('-') else prefix + name
+            for name in ordering
+        ]
+
+        if isinstance(field, serializers.ListSerializer):
+            self.plan = ValuesPlan(field.child, prefix)
+        elif isinstance(field, relations.ManyRelatedField) and isinstance(
+                field.child_relation, relations.PrimaryKeyRelatedField):
+            self.plan = None
+            self.pk_column = prefix + 'pk'
+            self.convert = converter(field.child_relation, None)
+        else:
+            raise UnsupportedField(field.field_name)
+        self.items = {}
+
+    def load(self, pks):
+        columns = self.plan.columns if self.plan else [self.pk_column]
+        rows = list(self.queryset.filter(**{f'{self.lookup}__in': pks})
+                    .order_by(*self.ordering).values(self.key, *columns))
+        if self.plan:
+            self.plan.load(rows)
+        self.items = {}
+        for row in rows:
+            if self.plan:
+                item = self.plan.represent(row)
+            else:
+                item = self.convert(row[self.pk_column])
+            self.items.setdefault(row[self.key], []).append(item)
+
+    def get(self, pk):
+        return self.items.get(pk, [])
@@ -0,0 +1,141 @@
+"""
+Sparse fieldsets and expandable relations.
+
+``?fields=id,form_number,property.zupin`` limits a response to the named
+fields and ``?expand=property,transferor`` names the relations that are
+inlined as nested objects; relations that are requested but not expanded
+are rendered as primary keys. Both take dotted paths for nested
+serializers. Without ``expand`` a serializer renders its relations as
+declared, so existing clients see no change.
+
+``narrow_queryset`` reads the resulting serializer to decide which columns
+to load and which relations to join or prefetch, so a relation that is not
+in the response costs no query at all.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def parse_paths(value):
+    """Split a comma separated query parameter, or ``None`` if absent."""
+    if value is None:
+        return None
+    return {path.strip() for path in value.split(',') if path.strip()}
+
+
+def top_level(paths):
+    return {path.split('.')[0] for path in paths}
+
+
+def nested_paths(paths, name):
+    """The remainders of the dotted ``paths`` below ``name``."""
+    prefix = name + '.'
+    return {path[len(prefix):] for path in paths if path.startswith(prefix)}
+
+
+def is_many(model, name):
+    field = model._meta.get_field(name)
+    return field.many_to_many or field.one_to_many
+
+
+class ExpandableFieldsMixin:
+    """
+    Accepts ``fields`` and ``expand`` keyword arguments, sets of dotted
+    paths as described above. ``Meta.expandable`` maps each relation that
+    can be inlined to the serializer used when it is.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self.selected_fields = fields
+        self.expand = expand
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.selected_fields:
+            selected = top_level(self.selected_fields)
+            fields = {name: field for name, field in fields.items()
+                      if name in selected}
+
+        for name, serializer_class in getattr(self.Meta, 'expandable', {}).items():
+            if name not in fields:
+                continue
+            declared = fields[name]
+            nested_fields = nested_paths(self.selected_fields or (), name) or None
+            many = is_many(self.Meta.model, name)
+            if self.expand is None:
+                # Relations render as declared, narrowed if asked to
+                if nested_fields and isinstance(declared, serializers.BaseSerializer):
+                    fields[name] = serializer_class(
+                        many=many, read_only=True, fields=nested_fields)
+            elif name in top_level(self.expand):
+                fields[name] = serializer_class(
+                    many=many, read_only=True, fields=nested_fields,
+                    expand=nested_paths(self.expand, name))
+            elif isinstance(declared, serializers.BaseSerializer):
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=many, read_only=True)
+        return fields
+
+
+def narrow_queryset(queryset, serializer, required=()):
+    """
+    Restrict ``queryset`` to what ``serializer`` reads: ``only()`` the
+    columns behind its fields, ``select_related`` inlined foreign keys and
+    prefetch many-valued relations, recursively for nested serializers.
+    ``required`` names extra columns to keep, e.g. a prefetch's join key.
+    """
+    columns, select, prefetches = _plan(queryset.model, serializer, '')
+    if columns is not None:
+        columns.update(required)
+        queryset = queryset.only('pk', *columns)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
+
+
+def _plan(model, serializer, prefix):
+    # columns is None when a field reads the whole object (source='*'),
+    # e.g. a SerializerMethodField, and so no column can be deferred.
+    columns, select, prefetches = set(), [], []
+    for field in serializer.fields.values():
+        if field.source == '*':
+            columns = None
+            continue
+        name = field.source.split('.')[0]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+
+        nested = field
+        if isinstance(field, serializers.ListSerializer):
+            nested = field.child
+        if not isinstance(nested, serializers.BaseSerializer):
+            nested = None
+
+        if model_field.many_to_many or model_field.one_to_many:
+            related = model_field.related_model._default_manager.all()
+            # A reverse foreign key is matched back on its own column
+            join = () if model_field.many_to_many else (model_field.field.name,)
+            if nested is not None:
+                related = narrow_queryset(related, nested, join)
+            else:
+                related = related.only('pk', *join)
+            prefetches.append(Prefetch(prefix + name, queryset=related))
+        elif model_field.concrete:
+            if columns is not None:
+                columns.add(prefix + name)
+            if nested is not None and model_field.is_relation:
+                select.append(prefix + name)
+                related_columns, related_select, related_prefetches = _plan(
+                    model_field.related_model, nested, f'{prefix}{name}__')
+                # Naming no column of the related row loads all of them
+                if columns is not None and related_columns is not None:
+                    columns.update(related_columns)
+                select.extend(related_select)
+                prefetches.extend(related_prefetches)
+    return columns, select, prefetches
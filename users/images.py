@@ -0,0 +1,78 @@
+"""
+WebP renditions of inspection photos.
+
+Inspectors upload full resolution camera images. After an upload commits,
+the renditions below are generated by a background job (``users.tasks``)
+and stored beside the original, e.g. ``inspections/site.jpg`` ->
+``inspections/site.thumbnail.webp``. Once they are all written the image
+is marked ``has_renditions``; until then the API offers no rendition URLs,
+so reads never touch storage or resize images.
+
+Renditions are written to a temporary name and moved into place, so racing
+jobs replace each other's file instead of saving suffixed copies. This needs
+a storage with local paths, like ``FileSystemStorage``.
+"""
+import logging
+import os
+import uuid
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from users import jobs
+from users.models import InspectionImage
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumbnail': (320, 320),
+    'medium': (1280, 1280),
+}
+
+WEBP_QUALITY = 80
+
+
+def rendition_name(name, rendition):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{rendition}.webp'
+
+
+def generate_rendition(name, rendition, storage=default_storage):
+    """Write one rendition of the stored image ``name`` and return its name."""
+    target = rendition_name(name, rendition)
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        image.thumbnail(RENDITIONS[rendition], Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+    temporary = storage.save(f'{target}.{uuid.uuid4().hex}.tmp', ContentFile(buffer.getvalue()))
+    try:
+        os.replace(storage.path(temporary), storage.path(target))
+    except BaseException:
+        storage.delete(temporary)
+        raise
+    return target
+
+
+def generate_renditions(name, storage=default_storage):
+    """Write every rendition of ``name`` and mark its images once all exist."""
+    complete = True
+    for rendition in RENDITIONS:
+        try:
+            generate_rendition(name, rendition, storage)
+        except Exception:
+            logger.exception('Could not generate %s rendition of %s', rendition, name)
+            complete = False
+    if complete:
+        InspectionImage.objects.filter(image=name, has_renditions=False).update(has_renditions=True)
+
+
+def schedule_renditions(name):
+    """Queue the renditions of ``name``, generated once the upload commits."""
+    jobs.enqueue('images.renditions', {'name': name}, key=f'renditions:{name}')
+
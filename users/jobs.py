@@ -0,0 +1,247 @@
+"""
+A database-backed queue for work that should not hold up a request.
+
+Request code calls ``enqueue()`` inside its own transaction, so a job is
+queued if and only if the write that needed it commits. Tasks are
+registered with ``@task`` (see ``users.tasks``) and receive the job's
+JSON payload as keyword arguments. A task runs in a transaction of its
+own and must be safe to run twice: a failed attempt is retried with
+exponential backoff until ``max_attempts``, and the job of a worker that
+died is queued again after ``JOB_LOCK_TIMEOUT`` seconds. Enqueueing a job
+under an ``idempotency_key`` that already exists is a no-op.
+
+Jobs are run by ``manage.py run_worker`` and, with ``JOBS_IN_PROCESS``
+on, by a small thread pool in the web process that is woken whenever a
+transaction that queued jobs commits. A poller thread in the web process
+also wakes it every ``JOB_POLL_INTERVAL`` seconds, after releasing stale
+jobs, so that retries whose backoff has passed and the jobs of recycled
+workers run without waiting for the next enqueue.
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from users import events
+from users.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first retry, doubled on every further attempt
+RETRY_DELAY = 10
+PURGE_INTERVAL = 60 * 60
+
+tasks = {}
+
+
+def task(name, max_attempts=5):
+    """Register the decorated function as the task ``name``."""
+    def register(function):
+        tasks[name] = (function, max_attempts)
+        return function
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """Queue the task ``name`` with ``payload`` once the transaction commits."""
+    _, max_attempts = tasks[name]
+    Job.objects.bulk_create([Job(
+        task=name,
+        payload=payload or {},
+        idempotency_key=key,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + datetime.timedelta(seconds=delay),
+    )], ignore_conflicts=True)
+    if getattr(settings, 'JOBS_IN_PROCESS', False):
+        transaction.on_commit(wake)
+
+
+def claim(limit):
+    """Lock up to ``limit`` due jobs for this worker and return them."""
+    now = timezone.now()
+    pks = list(Job.objects.filter(status='queued', run_after__lte=now)
+               .values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    # Conditional on the status, so each job is claimed by one worker only
+    lock = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}'
+    Job.objects.filter(pk__in=pks, status='queued').update(
+        status='running', locked_by=lock, locked_at=now, attempts=F('attempts') + 1)
+    return list(Job.objects.filter(locked_by=lock, status='running'))
+
+
+def finish(job, **fields):
+    # A job requeued as stale may have been claimed again meanwhile
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status='running').update(**fields)
+
+
+def run(job):
+    function, _ = tasks.get(job.task, (None, None))
+    try:
+        if function is None:
+            raise LookupError(f'Unknown task {job.task!r}')
+        with events.batch(), transaction.atomic():
+            function(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+            logger.warning('Job %s (%s) failed, retrying in %ss', job.pk, job.task, delay)
+            finish(job, status='queued', locked_by='', locked_at=None, last_error=error,
+                   run_after=timezone.now() + datetime.timedelta(seconds=delay))
+        else:
+            logger.error('Job %s (%s) failed after %d attempts', job.pk, job.task, job.attempts)
+            finish(job, status='failed', last_error=error, finished_at=timezone.now())
+    else:
+        finish(job, status='done', finished_at=timezone.now())
+
+
+def run_in_thread(job):
+    close_old_connections()
+    try:
+        run(job)
+    finally:
+        close_old_connections()
+
+
+def run_pending(batch_size=10):
+    """Run due jobs in this thread until there are none; returns how many ran."""
+    count = 0
+    while jobs := claim(batch_size):
+        for job in jobs:
+            run(job)
+        count += len(jobs)
+    return count
+
+
+def requeue_stale():
+    """Release the jobs of workers that stopped without finishing them."""
+    stale = Job.objects.filter(
+        status='running',
+        locked_at__lt=timezone.now() - datetime.timedelta(
+            seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 600)))
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', last_error='Worker stopped while running the job.',
+        finished_at=timezone.now())
+    return stale.update(status='queued', locked_by='', locked_at=None)
+
+
+def purge():
+    """Delete jobs that finished more than ``JOB_RETENTION_DAYS`` ago."""
+    cutoff = timezone.now() - datetime.timedelta(
+        days=getattr(settings, 'JOB_RETENTION_DAYS', 7))
+    return Job.objects.filter(
+        status__in=('done', 'failed'), finished_at__lt=cutoff).delete()[0]
+
+
+class Worker:
+    """
+    Polls the queue and runs jobs on ``threads`` threads; with one thread
+    jobs run in the calling thread.
+    """
+
+    def __init__(self, threads=1, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stopping = False
+        self.processed = 0
+
+    def run(self, once=False):
+        """Work until ``stop()`` or, with ``once``, until the queue is empty."""
+        purged_at = None
+        pool = ThreadPoolExecutor(self.threads, thread_name_prefix='jobs') if self.threads > 1 else None
+        running = set()
+        try:
+            while not self.stopping:
+                if purged_at is None or time.monotonic() - purged_at > PURGE_INTERVAL:
+                    purge()
+                    purged_at = time.monotonic()
+                requeue_stale()
+
+                free = self.threads - len(running)
+                jobs = claim(free) if free else []
+                for job in jobs:
+                    if pool is None:
+                        run(job)
+                    else:
+                        running.add(pool.submit(run_in_thread, job))
+                self.processed += len(jobs)
+
+                if running:
+                    _, running = wait(running, timeout=0 if jobs else self.poll_interval,
+                                      return_when=FIRST_COMPLETED)
+                elif not jobs:
+                    if once:
+                        break
+                    time.sleep(self.poll_interval)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+        return self.processed
+
+    def stop(self, *args):
+        self.stopping = True
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'JOB_WORKERS', 2), thread_name_prefix='jobs')
+    return _executor
+
+
+def drain(function=run_pending):
+    close_old_connections()
+    try:
+        function()
+    except Exception:
+        logger.exception('In-process job worker failed')
+    finally:
+        close_old_connections()
+
+
+def wake():
+    """Run due jobs in the web process's pool."""
+    start_poller()
+    get_executor().submit(drain)
+
+
+def tick():
+    requeue_stale()
+    return run_pending()
+
+
+_poller = None
+
+
+def poll():
+    while True:
+        time.sleep(getattr(settings, 'JOB_POLL_INTERVAL', 30))
+        get_executor().submit(drain, tick)
+
+
+def start_poller():
+    """Start this process's poller thread, unless it is running already."""
+    global _poller
+    with _executor_lock:
+        # A forked worker inherits the variable but not the thread
+        if _poller is None or _poller[0] != os.getpid():
+            thread = threading.Thread(target=poll, name='jobs-poller', daemon=True)
+            thread.start()
+            _poller = (os.getpid(), thread)
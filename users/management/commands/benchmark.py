@@ -0,0 +1,68 @@
+"""
+Run the transaction lifecycle benchmarks (``users.benchmarks``) against a
+scratch test database, e.g.
+
+    python manage.py benchmark --transactions 5000 --iterations 100
+    python manage.py benchmark --scenario list --scenario retrieve --json bench.json
+
+With ``--check`` the command fails when a scenario exceeds its query
+budget, so it can gate a deployment.
+"""
+import json
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from users.benchmarks import SCENARIOS, LifecycleBenchmark, format_report, over_budget, seed
+from users.models import StaffUser
+
+
+class Command(BaseCommand):
+    help = 'Seed a scratch database and benchmark the transaction lifecycle endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=1000,
+                            help='Transactions to seed before measuring.')
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Requests per scenario.')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Scenario to run; repeat for several. Default: all.')
+        parser.add_argument('--json', help='Also write the results to this file.')
+        parser.add_argument('--check', action='store_true',
+                            help='Fail if a scenario exceeds its query budget.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        media_root = tempfile.mkdtemp()
+        try:
+            # Jobs queued by the requests are left unprocessed
+            with override_settings(MEDIA_ROOT=media_root, JOBS_IN_PROCESS=False):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.stdout.write(format_report(results))
+        if options['json']:
+            with open(options['json'], 'w') as stream:
+                json.dump([result.summary() for result in results], stream, indent=2)
+        if options['check']:
+            problems = over_budget(results)
+            if problems:
+                raise CommandError('Query budget exceeded:\n' + '\n'.join(problems))
+
+    def run(self, options):
+        user = StaffUser.objects.create_user(
+            'benchmark@example.com', 'benchmark', first_name='Bench', last_name='Mark',
+            phone_number='0000000000', employee_id='BENCH', department='registry',
+            is_staff=True)
+        self.stdout.write(f'Seeding {options["transactions"]} transactions...')
+        transactions = seed(options['transactions'], created_by_id=user.pk)
+        benchmark = LifecycleBenchmark(user, transactions, iterations=options['iterations'])
+        return benchmark.run(options['scenario'] or SCENARIOS)
@@ -0,0 +1,70 @@
+"""
+Fire concurrent GET requests at a running server, e.g. to compare the
+WSGI and ASGI deployments on the same endpoints:
+
+    gunicorn project.wsgi:application --bind :5000 --workers 2 --threads 4
+    python manage.py loadtest http://localhost:5000/api/transactions/ --token <JWT>
+
+    gunicorn project.asgi:application --bind :5000 --workers 2 -k uvicorn.workers.UvicornWorker
+    python manage.py loadtest http://localhost:5000/api/transactions/ --token <JWT>
+
+Several URLs are requested round robin. ``--token`` defaults to the
+``LOADTEST_TOKEN`` environment variable.
+"""
+import itertools
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+
+def fetch(url, headers, timeout):
+    """Return ``(status, seconds)``; ``status`` is ``None`` on a network error."""
+    started = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except HTTPError as exc:
+        status = exc.code
+    except (URLError, OSError):
+        status = None
+    return status, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent GET requests at a running server and report throughput and latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', nargs='+')
+        parser.add_argument('--token', default=os.environ.get('LOADTEST_TOKEN'),
+                            help='JWT access token sent as a Bearer token.')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Bearer {options["token"]}'
+        urls = itertools.islice(itertools.cycle(options['url']), options['requests'])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(
+                lambda url: fetch(url, headers, options['timeout']), urls))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(seconds * 1000 for _, seconds in results)
+        failed = sum(1 for status, _ in results if status is None or status >= 400)
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f'{len(results)} requests, concurrency {options["concurrency"]}, '
+            f'{elapsed:.2f}s, {len(results) / elapsed:.1f} req/s\n'
+            f'latency p50 {percentiles[49]:.1f}ms, p95 {percentiles[94]:.1f}ms, '
+            f'p99 {percentiles[98]:.1f}ms, max {latencies[-1]:.1f}ms\n'
+            f'{failed} failed')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard statistics rollups from all transactions.'
+
+    def handle(self, *args, **options):
+        rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows.'))
@@ -0,0 +1,38 @@
+"""
+Process the background job queue (``users.jobs``), e.g. next to web
+processes started with JOBS_IN_PROCESS=0:
+
+    python manage.py run_worker --threads 4
+
+``--once`` runs the jobs that are due and exits. SIGTERM and Ctrl-C let
+the running jobs finish before the worker stops.
+"""
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOB_WORKERS,
+                            help='Jobs run concurrently.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between polls of an empty queue.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is due.')
+
+    def handle(self, *args, **options):
+        worker = Worker(max(options['threads'], 1), options['poll_interval'])
+        previous = {signum: signal.signal(signum, worker.stop)
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            processed = worker.run(once=options['once'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(f'Processed {processed} jobs.')
@@ -0,0 +1,318 @@
+"""
+Per-request query, timing and size metrics for the API.
+
+``RequestMetricsMiddleware`` tracks every ``/api/`` request in a context
+variable. Every database connection carries ``record_query`` as an
+execute wrapper (installed when the connection is created), which counts
+the queries and their time for the current request, including queries
+from the threads that run views under ASGI. ``serializing()`` marks
+serialization and is used by ``MetricsMixin`` and the ``values()`` fast
+path. Database time spent inside it, e.g. a prefetch, is not counted
+twice.
+
+Each response gets a ``Server-Timing`` header (db, serialize, app and
+total durations), and requests running more queries than their budget
+(``QUERY_BUDGET`` or a viewset's ``query_budget``) are logged and counted.
+Totals and histograms per route are kept by each process and written to
+the shared cache every ``METRICS_FLUSH_INTERVAL`` seconds, so that
+``/api/_metrics/`` reports all workers. Each process claims a numbered
+slot for itself with ``cache.incr`` and ``cache.add``, both atomic, so
+workers starting together cannot drop each other from the report.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+SLOTS_KEY = 'metrics:slots'
+SNAPSHOT_TIMEOUT = 7 * 24 * 60 * 60
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.query_budget = getattr(settings, 'QUERY_BUDGET', None)
+
+    def over_budget(self):
+        return self.query_budget is not None and self.queries > self.query_budget
+
+
+def current():
+    """The metrics of the request being served, or ``None``."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def instrument(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def serializing():
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    db_time = metrics.db_time
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.serialize_time += elapsed - (metrics.db_time - db_time)
+
+
+def new_histogram(bounds):
+    return [0] * (len(bounds) + 1)
+
+
+class RouteStats:
+    def __init__(self):
+        self.count = 0
+        self.over_budget = 0
+        self.total_ms = 0.0
+        self.db_ms = 0.0
+        self.serialize_ms = 0.0
+        self.queries = 0
+        self.bytes = 0
+        self.latency = new_histogram(LATENCY_BUCKETS_MS)
+        self.query_histogram = new_histogram(QUERY_BUCKETS)
+
+    def add(self, metrics, total_ms, size):
+        self.count += 1
+        self.over_budget += metrics.over_budget()
+        self.total_ms += total_ms
+        self.db_ms += metrics.db_time * 1000
+        self.serialize_ms += metrics.serialize_time * 1000
+        self.queries += metrics.queries
+        self.bytes += size or 0
+        self.latency[bisect_left(LATENCY_BUCKETS_MS, total_ms)] += 1
+        self.query_histogram[bisect_left(QUERY_BUCKETS, metrics.queries)] += 1
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class Registry:
+    """Route statistics of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.flushed_at = 0.0
+        self.slot = None
+        self.worker = None
+
+    def record(self, route, metrics, total_ms, size):
+        with self.lock:
+            self.routes.setdefault(route, RouteStats()).add(metrics, total_ms, size)
+            due = time.monotonic() - self.flushed_at >= getattr(
+                settings, 'METRICS_FLUSH_INTERVAL', 10)
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {route: stats.to_dict() for route, stats in self.routes.items()}
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        worker = worker_id()
+        cache.set(f'metrics:{worker}', self.snapshot(), SNAPSHOT_TIMEOUT)
+        # A forked worker inherits the registry of the process it was forked from
+        if (self.worker != worker or self.slot is None
+                or not cache.touch(slot_key(self.slot), SNAPSHOT_TIMEOUT)):
+            self.slot = claim_slot(worker)
+            self.worker = worker
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+        self.flushed_at = 0.0
+
+
+def worker_id():
+    # Not a constant: with preload_app gunicorn imports this module in the
+    # master, before forking the workers
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def slot_key(slot):
+    return f'metrics:slot:{slot}'
+
+
+def claim_slot(worker):
+    """Registers ``worker`` under the next free slot number."""
+    while True:
+        try:
+            slot = cache.incr(SLOTS_KEY)
+        except ValueError:
+            cache.add(SLOTS_KEY, 0, timeout=None)
+            continue
+        if cache.add(slot_key(slot), worker, SNAPSHOT_TIMEOUT):
+            return slot
+
+
+registry = Registry()
+
+
+def merge(into, stats):
+    for name, value in stats.items():
+        if isinstance(value, list):
+            into[name] = [a + b for a, b in zip(into[name], value)]
+        else:
+            into[name] += value
+
+
+def collect():
+    """Route statistics of every process that flushed to the shared cache."""
+    registry.flush()
+    slots = cache.get(SLOTS_KEY) or 0
+    workers = cache.get_many([slot_key(slot) for slot in range(1, slots + 1)]).values()
+    snapshots = cache.get_many([f'metrics:{worker}' for worker in workers])
+    routes = {}
+    for snapshot in snapshots.values():
+        for route, stats in snapshot.items():
+            if route in routes:
+                merge(routes[route], stats)
+            else:
+                routes[route] = dict(stats)
+
+    report = {}
+    for route, stats in sorted(routes.items()):
+        count = stats['count'] or 1
+        report[route] = {
+            'count': stats['count'],
+            'over_budget': stats['over_budget'],
+            'mean_ms': round(stats['total_ms'] / count, 2),
+            'mean_db_ms': round(stats['db_ms'] / count, 2),
+            'mean_serialize_ms': round(stats['serialize_ms'] / count, 2),
+            'mean_queries': round(stats['queries'] / count, 2),
+            'mean_bytes': round(stats['bytes'] / count),
+            'latency_ms': histogram(LATENCY_BUCKETS_MS, stats['latency']),
+            'queries': histogram(QUERY_BUCKETS, stats['query_histogram']),
+        }
+    return {'workers': len(snapshots), 'query_budget': getattr(settings, 'QUERY_BUDGET', None),
+            'routes': report}
+
+
+def histogram(bounds, counts):
+    """Bucket counts keyed by their upper bound, ``+Inf`` for the last."""
+    labels = [str(bound) for bound in bounds] + ['+Inf']
+    return dict(zip(labels, counts))
+
+
+def server_timing(metrics, total_ms):
+    db_ms = metrics.db_time * 1000
+    serialize_ms = metrics.serialize_time * 1000
+    app_ms = max(total_ms - db_ms - serialize_ms, 0)
+    return ', '.join([
+        f'db;dur={db_ms:.1f};desc="{metrics.queries} queries"',
+        f'serialize;dur={serialize_ms:.1f}',
+        f'app;dur={app_ms:.1f}',
+        f'total;dur={total_ms:.1f}',
+    ])
+
+
+class RequestMetricsMiddleware:
+    """Measures ``/api/`` requests, see the module docstring."""
+    sync_capable = True
+    async_capable = True
+    path_prefix = '/api/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not request.path.startswith(self.path_prefix):
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not request.path.startswith(self.path_prefix):
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = server_timing(metrics, total_ms)
+
+        match = request.resolver_match
+        route = f'{request.method} {match.view_name if match else "unresolved"}'
+        if metrics.over_budget():
+            logger.warning('%s ran %d queries, over its budget of %d (%s)',
+                           route, metrics.queries, metrics.query_budget, request.path)
+        registry.record(route, metrics, total_ms, size)
+        return response
+
+
+class MetricsMixin:
+    """
+    Times serialization of the serializers a viewset hands out and applies
+    the viewset's ``query_budget``, if set, instead of ``QUERY_BUDGET``.
+    """
+    query_budget = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        metrics = current()
+        if metrics is not None and self.query_budget is not None:
+            metrics.query_budget = self.query_budget
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        to_representation = serializer.to_representation
+
+        def timed(instance):
+            with serializing():
+                return to_representation(instance)
+        serializer.to_representation = timed
+        return serializer
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+STAGE_FLAGS = (
+    ('received', 'is_verified'),
+    ('approval', 'is_approved'),
+    ('valuation', 'is_valuation_done'),
+    ('urban_planning', 'is_urp_done'),
+    ('acre', 'is_acre_done'),
+    ('committee', 'is_committee_done'),
+    ('land_records', 'is_land_records_done'),
+    ('documentation', 'is_document_done'),
+    ('signing', 'is_signed'),
+)
+
+
+def populate_stage(apps, schema_editor):
+    Transaction = apps.get_model('users', 'Transaction')
+    done = {}
+    for stage, flag in STAGE_FLAGS:
+        Transaction.objects.filter(**done, **{flag: False}).update(stage=stage)
+        done[flag] = True
+    Transaction.objects.filter(**done).update(stage='completed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_rename_file_path_inspection_document_file_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='stage',
+            field=models.CharField(choices=[('received', 'Received'), ('approval', 'Awaiting Approval'), ('valuation', 'Valuation'), ('urban_planning', 'Urban Planning'), ('acre', '3 Acre Section'), ('committee', 'Committee'), ('land_records', 'Land Records'), ('documentation', 'Documentation'), ('signing', 'Signing'), ('completed', 'Completed')], default='received', editable=False, max_length=20),
+        ),
+        migrations.RunPython(populate_stage, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['stage', '-created_at'], name='transaction_stage_created'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('stage', 'completed'), _negated=True), fields=['-created_at'], name='transaction_open_created'),
+        ),
+    ]
@@ -0,0 +1,187 @@
+import sqlite3
+
+from django.db import migrations
+
+# Full-text search indexes for users.search. SQLite gets FTS5 trigram tables
+# kept in sync by triggers; PostgreSQL gets pg_trgm GIN indexes. The trigram
+# tokenizer needs SQLite 3.34, and older builds get no index at all.
+#
+# The property index is keyed on users_property's rowid, since its primary
+# key is a UUID and FTS5 can only look rows up quickly by rowid. SQLite
+# renumbers the rowids and drops the triggers whenever it rebuilds
+# users_property, users_transaction, users_party or users_customuser, which
+# it does for most AlterField/AddField operations. A migration doing that
+# must run drop_search_index first and build_search_index afterwards, as
+# 0015 and 0019 do.
+
+SQLITE_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34)
+
+PARTY_ROW = """
+    INSERT INTO users_party_fts(rowid, first_name, middle_name, last_name, identification, email, phone_number)
+    SELECT p.customuser_ptr_id, u.first_name, u.middle_name, u.last_name, p.identification, u.email, u.phone_number
+    FROM users_party p JOIN users_customuser u ON u.id = p.customuser_ptr_id
+    WHERE p.customuser_ptr_id = {id};
+"""
+
+PROPERTY_ROW = """
+    DELETE FROM users_property_fts WHERE rowid = {rowid};
+    INSERT INTO users_property_fts(rowid, property_id, transaction_id, zupin, locality, district, form_number, registration_number)
+    SELECT p.rowid, p.id, t.id, p.zupin, p.locality, p.district, t.form_number, t.registration_number
+    FROM users_property p LEFT JOIN users_transaction t ON t.property_id = p.id
+    WHERE p.rowid = {rowid};
+"""
+
+PROPERTY_ROWID = '(SELECT rowid FROM users_property WHERE id = {}.property_id)'
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE users_party_fts USING fts5(
+        first_name, middle_name, last_name, identification, email, phone_number,
+        tokenize = 'trigram'
+    )
+    """,
+    """
+    INSERT INTO users_party_fts(rowid, first_name, middle_name, last_name, identification, email, phone_number)
+    SELECT p.customuser_ptr_id, u.first_name, u.middle_name, u.last_name, p.identification, u.email, u.phone_number
+    FROM users_party p JOIN users_customuser u ON u.id = p.customuser_ptr_id
+    """,
+    f"""
+    CREATE TRIGGER users_party_fts_insert AFTER INSERT ON users_party BEGIN
+        {PARTY_ROW.format(id='new.customuser_ptr_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER users_party_fts_update AFTER UPDATE ON users_party BEGIN
+        DELETE FROM users_party_fts WHERE rowid = old.customuser_ptr_id;
+        {PARTY_ROW.format(id='new.customuser_ptr_id')}
+    END
+    """,
+    """
+    CREATE TRIGGER users_party_fts_delete AFTER DELETE ON users_party BEGIN
+        DELETE FROM users_party_fts WHERE rowid = old.customuser_ptr_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER users_customuser_fts_update
+    AFTER UPDATE OF first_name, middle_name, last_name, email, phone_number ON users_customuser BEGIN
+        DELETE FROM users_party_fts WHERE rowid = old.id;
+        {PARTY_ROW.format(id='new.id')}
+    END
+    """,
+    """
+    CREATE VIRTUAL TABLE users_property_fts USING fts5(
+        property_id UNINDEXED, transaction_id UNINDEXED,
+        zupin, locality, district, form_number, registration_number,
+        tokenize = 'trigram'
+    )
+    """,
+    """
+    INSERT INTO users_property_fts(rowid, property_id, transaction_id, zupin, locality, district, form_number, registration_number)
+    SELECT p.rowid, p.id, t.id, p.zupin, p.locality, p.district, t.form_number, t.registration_number
+    FROM users_property p LEFT JOIN users_transaction t ON t.property_id = p.id
+    """,
+    f"""
+    CREATE TRIGGER users_property_fts_insert AFTER INSERT ON users_property BEGIN
+        {PROPERTY_ROW.format(rowid='new.rowid')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER users_property_fts_update
+    AFTER UPDATE OF zupin, locality, district ON users_property BEGIN
+        DELETE FROM users_property_fts WHERE rowid = old.rowid;
+        {PROPERTY_ROW.format(rowid='new.rowid')}
+    END
+    """,
+    """
+    CREATE TRIGGER users_property_fts_delete AFTER DELETE ON users_property BEGIN
+        DELETE FROM users_property_fts WHERE rowid = old.rowid;
+    END
+    """,
+    f"""
+    CREATE TRIGGER users_transaction_fts_insert AFTER INSERT ON users_transaction BEGIN
+        {PROPERTY_ROW.format(rowid=PROPERTY_ROWID.format('new'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER users_transaction_fts_update
+    AFTER UPDATE OF form_number, registration_number, property_id ON users_transaction BEGIN
+        {PROPERTY_ROW.format(rowid=PROPERTY_ROWID.format('old'))}
+        {PROPERTY_ROW.format(rowid=PROPERTY_ROWID.format('new'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER users_transaction_fts_delete AFTER DELETE ON users_transaction BEGIN
+        {PROPERTY_ROW.format(rowid=PROPERTY_ROWID.format('old'))}
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    f'DROP TRIGGER IF EXISTS {trigger}' for trigger in (
+        'users_party_fts_insert',
+        'users_party_fts_update',
+        'users_party_fts_delete',
+        'users_customuser_fts_update',
+        'users_property_fts_insert',
+        'users_property_fts_update',
+        'users_property_fts_delete',
+        'users_transaction_fts_insert',
+        'users_transaction_fts_update',
+        'users_transaction_fts_delete',
+    )
+] + [
+    'DROP TABLE IF EXISTS users_party_fts',
+    'DROP TABLE IF EXISTS users_property_fts',
+]
+
+TRIGRAM_INDEXES = [
+    ('users_customuser', 'first_name'),
+    ('users_customuser', 'middle_name'),
+    ('users_customuser', 'last_name'),
+    ('users_customuser', 'email'),
+    ('users_customuser', 'phone_number'),
+    ('users_party', 'identification'),
+    ('users_property', 'zupin'),
+    ('users_property', 'locality'),
+    ('users_property', 'district'),
+    ('users_transaction', 'form_number'),
+    ('users_transaction', 'registration_number'),
+]
+
+POSTGRES_FORWARD = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)'
+    for table, column in TRIGRAM_INDEXES
+]
+
+POSTGRES_REVERSE = [
+    f'DROP INDEX IF EXISTS {table}_{column}_trgm' for table, column in TRIGRAM_INDEXES
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for vendor, sql in statements.items():
+            if vendor == 'sqlite' and sql is SQLITE_FORWARD and not SQLITE_TRIGRAM:
+                continue
+            if schema_editor.connection.vendor == vendor:
+                for statement in sql:
+                    schema_editor.execute(statement, params=None)
+    return apply
+
+
+drop_search_index = run({'sqlite': SQLITE_REVERSE})
+build_search_index = run({'sqlite': SQLITE_FORWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
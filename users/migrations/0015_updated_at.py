@@ -0,0 +1,42 @@
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+# SQLite adds columns by rebuilding the table, which breaks the search
+# triggers and renumbers users_property rowids, so the FTS index from 0014
+# is dropped first and rebuilt from scratch afterwards.
+search_indexes = import_module('users.migrations.0014_search_indexes')
+drop_search_index = search_indexes.drop_search_index
+build_search_index = search_indexes.build_search_index
+
+
+def backfill_updated_at(apps, schema_editor):
+    for name in ('Property', 'Transaction'):
+        apps.get_model('users', name).objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_index, build_search_index),
+        migrations.AddField(
+            model_name='property',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_work_items(apps, schema_editor):
+    TransactionAssignment = apps.get_model('users', 'TransactionAssignment')
+    WorkItem = apps.get_model('users', 'WorkItem')
+    WorklistCounter = apps.get_model('users', 'WorklistCounter')
+
+    items = []
+    assignments = TransactionAssignment.objects.select_related(
+        'transaction', 'assigned_to_optional').prefetch_related('assigned_to_mandatory')
+    for assignment in assignments.iterator(chunk_size=500):
+        slots = {}
+        if assignment.assigned_to_optional is not None:
+            slots[assignment.assigned_to_optional.pk] = (assignment.assigned_to_optional, 'optional')
+        for staff in assignment.assigned_to_mandatory.all():
+            slots[staff.pk] = (staff, 'mandatory')
+        for staff, slot in slots.values():
+            items.append(WorkItem(
+                assignment=assignment, transaction_id=assignment.transaction_id, staff=staff,
+                department=staff.department, slot=slot, assigned_at=assignment.created_at,
+                is_open=assignment.transaction.stage != 'completed'))
+    WorkItem.objects.bulk_create(items, batch_size=500)
+
+    open_items = WorkItem.objects.filter(is_open=True).order_by()
+    counters = [
+        WorklistCounter(scope='staff', key=str(row['staff']), open_count=row['count'])
+        for row in open_items.values('staff').annotate(count=models.Count('pk'))
+    ] + [
+        WorklistCounter(scope='department', key=row['department'], open_count=row['count'])
+        for row in open_items.values('department').annotate(count=models.Count('pk'))
+    ]
+    WorklistCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(choices=[('registry', 'Registry'), ('executive_secretary', 'Executive Secretary'), ('coordination_unit', 'Coordination Unit'), ('urban_planning', 'Urban Planning'), ('valuation', 'Valuation'), ('3_acre_section', '3 Acre Section'), ('committee', 'Committee'), ('lease_section', 'Lease Section'), ('land_title', 'Land Title')], max_length=20)),
+                ('slot', models.CharField(choices=[('mandatory', 'Mandatory'), ('optional', 'Optional')], max_length=10)),
+                ('is_open', models.BooleanField(default=True)),
+                ('assigned_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Work Item',
+                'verbose_name_plural': 'Work Items',
+                'ordering': ('-assigned_at',),
+            },
+        ),
+        migrations.CreateModel(
+            name='WorklistCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('staff', 'Staff'), ('department', 'Department')], max_length=10)),
+                ('key', models.CharField(max_length=40)),
+                ('open_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Worklist Counter',
+                'verbose_name_plural': 'Worklist Counters',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='worklistcounter',
+            constraint=models.UniqueConstraint(fields=('scope', 'key'), name='worklist_counter_scope_key'),
+        ),
+        migrations.AddField(
+            model_name='workitem',
+            name='assignment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='work_items', to='users.transactionassignment'),
+        ),
+        migrations.AddField(
+            model_name='workitem',
+            name='staff',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='work_items', to='users.staffuser'),
+        ),
+        migrations.AddField(
+            model_name='workitem',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='work_items', to='users.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='workitem',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['staff', '-assigned_at'], name='work_item_staff_open'),
+        ),
+        migrations.AddIndex(
+            model_name='workitem',
+            index=models.Index(condition=models.Q(('is_open', True)), fields=['department', '-assigned_at'], name='work_item_department_open'),
+        ),
+        migrations.AddConstraint(
+            model_name='workitem',
+            constraint=models.UniqueConstraint(fields=('assignment', 'staff'), name='work_item_assignment_staff'),
+        ),
+        migrations.RunPython(populate_work_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:17
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_stats(apps, schema_editor):
+    Transaction = apps.get_model('users', 'Transaction')
+    StatsRollup = apps.get_model('users', 'StatsRollup')
+
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    rows = Transaction.objects.order_by().values_list(
+        'stage', 'type', 'purchase_price', 'created_at', 'property__district')
+    for stage, type_, price, created_at, district in rows.iterator(chunk_size=2000):
+        month = timezone.localtime(created_at).strftime('%Y-%m')
+        for key in (('total', ''), ('stage', stage), ('district', district),
+                    ('type', type_), ('month', month)):
+            totals[key][0] += 1
+            totals[key][1] += price or 0
+    StatsRollup.objects.bulk_create([
+        StatsRollup(dimension=dimension, key=key,
+                    transaction_count=count, purchase_price_total=price)
+        for (dimension, key), (count, price) in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_worklists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Total'), ('stage', 'Stage'), ('district', 'District'), ('type', 'Type'), ('month', 'Month')], max_length=10)),
+                ('key', models.CharField(max_length=50)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('purchase_price_total', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'verbose_name': 'Stats Rollup',
+                'verbose_name_plural': 'Stats Rollups',
+                'ordering': ('dimension', 'key'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='statsrollup',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='stats_rollup_dimension_key'),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite adds the column by rebuilding the table, see 0015_updated_at
+search_indexes = import_module('users.migrations.0014_search_indexes')
+drop_search_index = search_indexes.drop_search_index
+build_search_index = search_indexes.build_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0018_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_index, build_search_index),
+        migrations.AddField(
+            model_name='transaction',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0019_transaction_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('flag', 'Flag changed')], max_length=20)),
+                ('changes', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('transaction', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='users.transaction')),
+            ],
+            options={
+                'verbose_name': 'Transaction Event',
+                'verbose_name_plural': 'Transaction Events',
+                'ordering': ('created_at',),
+                'indexes': [models.Index(fields=['transaction', 'created_at'], name='transaction_event_timeline')],
+            },
+        ),
+    ]
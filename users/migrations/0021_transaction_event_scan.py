@@ -0,0 +1,22 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0020_transaction_events'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transactionevent',
+            name='action',
+            field=models.CharField(choices=[('created', 'Created'), ('flag', 'Flag changed'), ('assigned', 'Assigned'), ('unassigned', 'Unassigned'), ('inspected', 'Inspected')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='transactionevent',
+            index=models.Index(fields=['created_at', 'id'], name='transaction_event_created'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:20
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def queue_renditions(apps, schema_editor):
+    # Renditions are no longer generated on read, so queue the job for
+    # images uploaded before; it marks them once their renditions exist.
+    # A separate key, as the upload's own job may be kept as done.
+    InspectionImage = apps.get_model('users', 'InspectionImage')
+    Job = apps.get_model('users', 'Job')
+    names = InspectionImage.objects.exclude(image='').values_list('image', flat=True).distinct()
+    Job.objects.bulk_create([
+        Job(task='images.renditions', payload={'name': name}, idempotency_key=f'renditions-backfill:{name}',
+            max_attempts=3, run_after=timezone.now())
+        for name in names.iterator()
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0021_transaction_event_scan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inspectionimage',
+            name='has_renditions',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(queue_renditions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+def delete_total(apps, schema_editor):
+    # The total is now added up from the district rows, see users.stats
+    StatsRollup = apps.get_model('users', 'StatsRollup')
+    StatsRollup.objects.filter(dimension='total').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0022_inspectionimage_has_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='statsrollup',
+            name='dimension',
+            field=models.CharField(choices=[('stage', 'Stage'), ('district', 'District'), ('type', 'Type'), ('month', 'Month')], max_length=10),
+        ),
+        migrations.RunPython(delete_total, migrations.RunPython.noop),
+    ]
@@ -2,12 +2,17 @@ import uuid
 from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.db import models, router
+from django.db.models.signals import post_save, pre_save
 from django.utils import timezone
 from rest_framework import permissions
 from django.utils.translation import gettext_lazy as _
 
 
+class StaleVersion(Exception):
+    """A transaction was saved over a newer version of its row."""
+
+
 def validate_positive(value):
     if value < 0:
         raise ValidationError(
@@ -201,6 +206,7 @@ class Property(models.Model):
     locality = models.CharField(max_length=30)
     district = models.CharField(max_length=30)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     # created_by = models.ForeignKey(StaffUser,on_delete=models.SET_NULL, related_name="created_properties")
 
     class Meta:
@@ -220,6 +226,33 @@ class Transaction(models.Model):
         ('lease', 'Lease'),
     ]
 
+    # Pipeline steps in order, each with the flag that completes it. The
+    # stage of a transaction is the first step whose flag is still False.
+    STAGE_FLAGS = (
+        ('received', 'is_verified'),
+        ('approval', 'is_approved'),
+        ('valuation', 'is_valuation_done'),
+        ('urban_planning', 'is_urp_done'),
+        ('acre', 'is_acre_done'),
+        ('committee', 'is_committee_done'),
+        ('land_records', 'is_land_records_done'),
+        ('documentation', 'is_document_done'),
+        ('signing', 'is_signed'),
+    )
+
+    STAGE_CHOICES = [
+        ('received', 'Received'),
+        ('approval', 'Awaiting Approval'),
+        ('valuation', 'Valuation'),
+        ('urban_planning', 'Urban Planning'),
+        ('acre', '3 Acre Section'),
+        ('committee', 'Committee'),
+        ('land_records', 'Land Records'),
+        ('documentation', 'Documentation'),
+        ('signing', 'Signing'),
+        ('completed', 'Completed'),
+    ]
+
     id = models.UUIDField(default=uuid.uuid4,
                           primary_key=True, editable=False, db_index=True)
     form_number = models.CharField(max_length=20, unique=True)
@@ -235,8 +268,8 @@ class Transaction(models.Model):
     transferee = models.ManyToManyField(
         Party, related_name="transferee_applications")
     file_path = models.FileField(upload_to=upload_to, blank=True, null=True)
-    # stage = models.CharField(max_length=50, choices=STAGE_CHOICES, default='received')
-    # current_stage = models.CharField(max_length=50, choices=STAGE_CHOICES, default='received')
+    stage = models.CharField(
+        max_length=20, choices=STAGE_CHOICES, default='received', editable=False)
     is_verified = models.BooleanField(default=False)
     is_approved = models.BooleanField(default=False)
     is_valuation_done = models.BooleanField(default=False)
@@ -247,8 +280,10 @@ class Transaction(models.Model):
     is_document_done = models.BooleanField(default=False)
     is_signed = models.BooleanField(default=False)
     notes = models.TextField(blank=True)
+    # Bumped by every write, see users.transitions
+    version = models.PositiveIntegerField(default=1, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    # updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     created_by = models.ForeignKey(
         StaffUser, on_delete=models.SET_NULL, blank=True, null=True, related_name="created_transactions")
 
@@ -256,10 +291,63 @@ class Transaction(models.Model):
         verbose_name = 'Transaction'
         verbose_name_plural = 'Transactions'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['stage', '-created_at'],
+                         name='transaction_stage_created'),
+            models.Index(fields=['-created_at'], condition=~models.Q(stage='completed'),
+                         name='transaction_open_created'),
+        ]
 
     def __str__(self):
         return self.registration_number
 
+    @classmethod
+    def stage_for(cls, flags):
+        """The stage of a transaction whose flags have the given values."""
+        for stage, flag in cls.STAGE_FLAGS:
+            if not flags[flag]:
+                return stage
+        return 'completed'
+
+    def get_stage(self):
+        # getattr loads deferred flags, which vars() would lack
+        return self.stage_for({flag: getattr(self, flag) for _, flag in self.STAGE_FLAGS})
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # Keep the denormalized stage in step with the flags it is derived
+        # from, and updated_at and the version current even when
+        # update_fields is given
+        self.stage = self.get_stage()
+        if update_fields is not None:
+            update_fields = {*update_fields, 'stage', 'updated_at', 'version'}
+        if self._state.adding or force_insert:
+            super().save(force_insert=force_insert, force_update=force_update,
+                         using=using, update_fields=update_fields)
+        else:
+            self.save_version(using or router.db_for_write(type(self), instance=self), update_fields)
+
+    def save_version(self, using, update_fields):
+        """
+        The UPDATE of ``save()`` as one statement that also bumps the
+        version, conditional on the version this instance was read at
+        (like ``users.transitions.update_transaction``).
+        """
+        cls = type(self)
+        pre_save.send(sender=cls, instance=self, raw=False, using=using, update_fields=update_fields)
+        values = {
+            field.attname: field.pre_save(self, False)
+            for field in cls._meta.local_concrete_fields
+            if not field.primary_key and field.name != 'version'
+            and (update_fields is None or {field.name, field.attname} & update_fields)
+        }
+        if not cls._base_manager.using(using).filter(pk=self.pk, version=self.version).update(
+                **values, version=models.F('version') + 1):
+            raise StaleVersion()
+        self.version += 1
+        self._state.db = using
+        post_save.send(sender=cls, instance=self, created=False, update_fields=update_fields,
+                       raw=False, using=using)
+
 
 class TransactionAssignment(models.Model):
     transaction = models.ForeignKey(
@@ -328,6 +416,225 @@ class InspectionImage(models.Model):
     inspection = models.ForeignKey(Inspection, on_delete=models.CASCADE,
                                    related_name='images')
     image = models.ImageField(upload_to="inspections/")
+    # Set by the renditions job (users.images); until then there are none
+    has_renditions = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Image for {self.inspection.transaction_assigned.transaction}"
+
+
+class ChunkedUpload(models.Model):
+    """
+    A document being uploaded in pieces. Chunks are appended to a partial
+    file under MEDIA_ROOT and the finished file is attached to its target.
+    """
+    TARGET_CHOICES = [
+        ('transaction', 'Transaction'),
+        ('inspection', 'Inspection'),
+    ]
+
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(default=uuid.uuid4,
+                          primary_key=True, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    target_id = models.CharField(max_length=36)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="chunked_uploads")
+
+    class Meta:
+        verbose_name = 'Chunked Upload'
+        verbose_name_plural = 'Chunked Uploads'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def partial_name(self):
+        return f'chunked_uploads/{self.id}.part'
+
+
+class TransactionEvent(models.Model):
+    """
+    An append-only record of a change to a transaction, see
+    ``users.events``. Rows outlive the transaction they describe, so there
+    is no database constraint, and the timeline index serves lookups by
+    transaction.
+    """
+    ACTION_CHOICES = [
+        ('created', 'Created'),
+        ('flag', 'Flag changed'),
+        ('assigned', 'Assigned'),
+        ('unassigned', 'Unassigned'),
+        ('inspected', 'Inspected'),
+    ]
+
+    transaction = models.ForeignKey(
+        Transaction, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name="events")
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    # Changed fields as {field: [old, new]}
+    changes = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Transaction Event'
+        verbose_name_plural = 'Transaction Events'
+        ordering = ('created_at',)
+        indexes = [
+            models.Index(fields=['transaction', 'created_at'], name='transaction_event_timeline'),
+            models.Index(fields=['created_at', 'id'], name='transaction_event_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.transaction_id} {self.action} at {self.created_at}'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Transaction events are append-only.')
+        super().save(*args, **kwargs)
+
+
+class WorkItem(models.Model):
+    """
+    One staff member's slot on an assignment, mandatory or optional,
+    denormalized so a person's or a department's worklist is a single
+    index range scan. Maintained by ``users.worklists``.
+    """
+    SLOT_CHOICES = [
+        ('mandatory', 'Mandatory'),
+        ('optional', 'Optional'),
+    ]
+
+    assignment = models.ForeignKey(
+        TransactionAssignment, on_delete=models.CASCADE, related_name="work_items")
+    transaction = models.ForeignKey(
+        Transaction, on_delete=models.CASCADE, related_name="work_items")
+    staff = models.ForeignKey(
+        StaffUser, on_delete=models.CASCADE, related_name="work_items")
+    department = models.CharField(
+        max_length=20, choices=StaffUser.DEPARTMENT_CHOICES)
+    slot = models.CharField(max_length=10, choices=SLOT_CHOICES)
+    is_open = models.BooleanField(default=True)
+    assigned_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Work Item'
+        verbose_name_plural = 'Work Items'
+        ordering = ('-assigned_at',)
+        constraints = [
+            models.UniqueConstraint(fields=['assignment', 'staff'],
+                                    name='work_item_assignment_staff'),
+        ]
+        indexes = [
+            models.Index(fields=['staff', '-assigned_at'], condition=models.Q(is_open=True),
+                         name='work_item_staff_open'),
+            models.Index(fields=['department', '-assigned_at'], condition=models.Q(is_open=True),
+                         name='work_item_department_open'),
+        ]
+
+    def __str__(self):
+        return f'{self.staff} - {self.assignment}'
+
+
+class WorklistCounter(models.Model):
+    """Number of open work items per staff member and per department."""
+    SCOPE_CHOICES = [
+        ('staff', 'Staff'),
+        ('department', 'Department'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=40)
+    open_count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Worklist Counter'
+        verbose_name_plural = 'Worklist Counters'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'],
+                                    name='worklist_counter_scope_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.key} = {self.open_count}'
+
+
+class StatsRollup(models.Model):
+    """Number and total purchase price of transactions per dimension value."""
+    DIMENSION_CHOICES = [
+        ('stage', 'Stage'),
+        ('district', 'District'),
+        ('type', 'Type'),
+        ('month', 'Month'),
+    ]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=50)
+    transaction_count = models.IntegerField(default=0)
+    purchase_price_total = models.DecimalField(
+        max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Stats Rollup'
+        verbose_name_plural = 'Stats Rollups'
+        ordering = ('dimension', 'key')
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'],
+                                    name='stats_rollup_dimension_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimension}:{self.key} = {self.transaction_count}'
+
+
+class Job(models.Model):
+    """
+    A unit of background work queued by a request and run by a worker,
+    see ``users.jobs``.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Enqueueing a job whose key is already queued, or done, is a no-op
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        ordering = ('run_after',)
+        indexes = [
+            models.Index(fields=['run_after'], condition=models.Q(status='queued'),
+                         name='job_queued'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} ({self.status})'
@@ -0,0 +1,170 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the queryset's first ordering field with the
+    primary key as a tiebreaker, e.g. ``(-created_at, -id)``.
+
+    Each page is a ``WHERE (created_at, id) < (...) LIMIT n`` range scan, so
+    deep pages cost the same as the first one and no ``COUNT(*)`` is run.
+    """
+    cursor_query_param = 'cursor'
+    page_size = None
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def get_ordering(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        field = ordering[0] if ordering else '-pk'
+        descending = field.startswith('-')
+        return field.lstrip('-'), descending
+
+    def encode_cursor(self, instance, reverse):
+        if isinstance(instance, dict):
+            # A values() row, as paginated by users.fastpath
+            instance = self.model(**{
+                'pk': instance['pk'], self.field.attname: instance[self.field.name]})
+        position = self.field.value_to_string(instance)
+        data = [position, str(instance.pk), reverse]
+        cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position, pk, reverse = json.loads(
+                base64.urlsafe_b64decode(encoded.encode()).decode())
+            return self.field.to_python(position), self.pk_field.to_python(pk), bool(reverse)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        name, descending = self.get_ordering(queryset)
+        model = self.model = queryset.model
+        self.pk_field = model._meta.pk
+        self.field = self.pk_field if name == 'pk' else model._meta.get_field(name)
+        self.base_url = request.build_absolute_uri()
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor[2] if cursor else False
+        # Walking backwards flips the comparison and the sort direction.
+        forwards = descending != reverse
+        prefix = '-' if forwards else ''
+        queryset = queryset.order_by(prefix + self.field.name, prefix + 'pk')
+
+        if cursor:
+            position, pk, _ = cursor
+            lookup = 'lt' if forwards else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field.name}__{lookup}': position})
+                | Q(**{self.field.name: position, f'pk__{lookup}': pk}))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else bool(cursor)
+        self.has_previous = bool(cursor) if not reverse else has_more
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class CountedKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination that reports a ``count`` the view already knows,
+    e.g. from a maintained counter, instead of running ``COUNT(*)``.
+    """
+    count = None
+
+    def __init__(self, page_size=None):
+        super().__init__(page_size or api_settings.PAGE_SIZE)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data = {'count': self.count, **response.data}
+        return response
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination by default. Clients opt into keyset pagination
+    with ``?pagination=cursor`` and then follow the returned ``next`` /
+    ``previous`` links, which carry a ``cursor`` parameter.
+    """
+    mode_query_param = 'pagination'
+    keyset = None
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or KeysetPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            page_size = self.get_page_size(request)
+            if not page_size:
+                return None
+            self.keyset = KeysetPagination(page_size)
+            self.display_page_controls = False
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count']['description'] = 'Omitted when paginating with a cursor.'
+        return schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" to paginate with keyset cursors.',
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': KeysetPagination.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+        ]
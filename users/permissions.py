@@ -4,6 +4,8 @@ from rest_framework.request import Request
 
 from django.db import models
 
+from users.models import StaffUser
+
 
 class UserPermission(permissions.BasePermission):
 
@@ -50,6 +52,16 @@ class IsStaffUser(permissions.BasePermission):
         return request.user.is_staff
 
 
+class IsCoordinator(permissions.BasePermission):
+    def has_permission(self, request, view):
+        # Staff users and members of the Coordination Unit
+        user = request.user
+        if not user.is_authenticated:
+            return False
+        return user.is_staff or StaffUser.objects.filter(
+            pk=user.pk, department='coordination_unit').exists()
+
+
 class OwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
@@ -0,0 +1,71 @@
+"""
+JSON renderer and parser backed by orjson.
+
+orjson encodes UUIDs, dates and nested dicts/lists natively in C, which is
+most of the cost of rendering large transaction lists. Output matches
+``rest_framework.renderers.JSONRenderer`` byte for byte, except that raw
+``datetime`` values (ones not already formatted by a serializer field) use
+the project's ``DATETIME_FORMAT`` like serializer output does.
+
+orjson is a dependency, and project/production.py refuses to start without
+it. Elsewhere both classes fall back to the standard library through DRF's
+own implementation, with the same output.
+"""
+import datetime
+
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+_datetime_field = serializers.DateTimeField()
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            return _datetime_field.to_representation(obj)
+        return super().default(obj)
+
+
+# Called by orjson for anything it doesn't encode itself
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_default, option=(
+            orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS))
+        # Escape U+2028/U+2029 like JSONRenderer so output stays valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
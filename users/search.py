@@ -0,0 +1,152 @@
+"""
+Ranked search over parties and properties/transactions.
+
+On SQLite the indexes are FTS5 tables using the trigram tokenizer, kept in
+sync by triggers (see migration 0014). A query first looks for rows that
+contain every search term; if that leaves room under the limit, the rest
+is filled from rows sharing the most trigrams with the terms, which is
+what makes misspelt names still match. The tokenizer needs SQLite 3.34;
+on older builds migration 0014 creates no index and every term is
+matched with ``icontains`` instead, without typo tolerance. On PostgreSQL
+the same columns carry pg_trgm GIN indexes and results are ranked by
+``word_similarity``.
+
+Each function returns primary keys in rank order.
+"""
+import re
+import uuid
+from functools import reduce
+from operator import and_, or_
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from users.models import Party, Property
+
+MIN_TERM_LENGTH = 3
+TRIGRAM_THRESHOLD = 0.3
+
+PARTY_COLUMNS = ('u.first_name', 'u.middle_name', 'u.last_name',
+                 'p.identification', 'u.email', 'u.phone_number')
+PROPERTY_COLUMNS = ('p.zupin', 'p.locality', 'p.district',
+                    't.form_number', 't.registration_number')
+PARTY_FIELDS = ('first_name', 'middle_name', 'last_name', 'identification', 'email', 'phone_number')
+PROPERTY_FIELDS = ('zupin', 'locality', 'district',
+                   'transaction__form_number', 'transaction__registration_number')
+
+_fts_tables = None
+
+
+def terms(query):
+    """Split a query into lower case search terms FTS5 can match."""
+    return [term for term in re.findall(r'[\w@.+-]+', query.lower())
+            if len(term) >= MIN_TERM_LENGTH]
+
+
+def _quote(term):
+    return '"{}"'.format(term.replace('"', '""'))
+
+
+def _trigrams(term):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def has_fts():
+    """Whether migration 0014 could create the FTS5 tables."""
+    global _fts_tables
+    if _fts_tables is None:
+        _fts_tables = 'users_party_fts' in connection.introspection.table_names()
+    return _fts_tables
+
+
+def _contains_match(queryset, fields, query, limit):
+    words = terms(query)
+    if not words:
+        return []
+    condition = reduce(and_, (
+        reduce(or_, (Q(**{f'{field}__icontains': word}) for field in fields)) for word in words))
+    return list(queryset.filter(condition)[:limit])
+
+
+def _sqlite_match(table, columns, query, limit, where=''):
+    words = terms(query)
+    if not words:
+        return []
+    sql = (f'SELECT {", ".join(columns)} FROM {table} '
+           f'WHERE {table} MATCH %s {where} ORDER BY rank LIMIT %s')
+    exact = ' AND '.join(_quote(word) for word in words)
+    fuzzy = ' OR '.join(_quote(gram) for word in words for gram in sorted(_trigrams(word)))
+
+    rows = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [exact, limit])
+        rows.extend(cursor.fetchall())
+        if len(rows) < limit:
+            cursor.execute(sql, [fuzzy, limit + len(rows)])
+            seen = set(rows)
+            rows.extend(row for row in cursor.fetchall() if row not in seen)
+    return rows[:limit]
+
+
+def _postgres_match(select, joins, columns, query, limit):
+    similar = ' OR '.join(f'%s <%% {column}' for column in columns)
+    prefix = ' OR '.join(f'{column} ILIKE %s' for column in columns)
+    rank = ', '.join(f'word_similarity(%s, {column})' for column in columns)
+    sql = (f'SELECT {select} FROM {joins} '
+           f'WHERE {similar} OR {prefix} '
+           f'ORDER BY GREATEST({rank}) DESC LIMIT %s')
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    params = ([query] * len(columns) + [escaped + '%'] * len(columns)
+              + [query] * len(columns) + [limit])
+    # SET LOCAL ends with the transaction instead of staying on the
+    # (possibly persistent) connection
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SET LOCAL pg_trgm.word_similarity_threshold = {TRIGRAM_THRESHOLD}')
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_parties(query, limit=20):
+    """Party ids matching names, identification, email or phone number."""
+    if connection.vendor == 'postgresql':
+        rows = _postgres_match(
+            'p.customuser_ptr_id',
+            'users_party p JOIN users_customuser u ON u.id = p.customuser_ptr_id',
+            PARTY_COLUMNS, query, limit)
+    elif has_fts():
+        rows = _sqlite_match('users_party_fts', ('rowid',), query, limit)
+    else:
+        rows = _contains_match(
+            Party.objects.order_by('pk').values_list('pk'), PARTY_FIELDS, query, limit)
+    return [row[0] for row in rows]
+
+
+def _search_properties(query, limit, transactions_only):
+    if connection.vendor == 'postgresql':
+        join = 'JOIN' if transactions_only else 'LEFT JOIN'
+        return _postgres_match(
+            'p.id, t.id',
+            f'users_property p {join} users_transaction t ON t.property_id = p.id',
+            PROPERTY_COLUMNS, query, limit)
+    if not has_fts():
+        properties = Property.objects.order_by('pk').values_list('pk', 'transaction__pk')
+        if transactions_only:
+            properties = properties.filter(transaction__isnull=False)
+        return _contains_match(properties, PROPERTY_FIELDS, query, limit)
+    return _sqlite_match(
+        'users_property_fts', ('property_id', 'transaction_id'), query, limit,
+        where='AND transaction_id IS NOT NULL' if transactions_only else '')
+
+
+def _uuid(value):
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(value)
+
+
+def search_properties(query, limit=20):
+    """Property ids matching zupin, locality, district or transaction numbers."""
+    return [_uuid(row[0]) for row in _search_properties(query, limit, False)]
+
+
+def search_transactions(query, limit=20):
+    """Transaction ids matching form/registration number or property fields."""
+    return [_uuid(row[1]) for row in _search_properties(query, limit, True)]
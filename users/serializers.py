@@ -4,7 +4,15 @@ from django.db import transaction
 from django.contrib.auth import get_user_model
 # from drf_extra_fields.fields import Base64FileField
 
-from users.models import Party, Property, StaffUser, Transaction, TransactionAssignment, Inspection, InspectionImage
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+
+from users.fieldsets import ExpandableFieldsMixin
+from users.images import rendition_name, schedule_renditions
+from users.transitions import update_transaction
+from users.uploads import TARGETS, clean_filename
+from users.models import ChunkedUpload, Party, Property, StaffUser, Transaction, TransactionAssignment, TransactionEvent, Inspection, InspectionImage, WorkItem
 
 User = get_user_model()
 
@@ -43,7 +51,7 @@ class ChangePasswordSerializer(serializers.Serializer):
 #         return instance
 
 
-class PartySerializer(serializers.ModelSerializer):
+class PartySerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Party
         fields = (
@@ -81,13 +89,13 @@ class StaffUserSerializer(serializers.ModelSerializer):
         )
 
 
-class PropertySerializer(serializers.ModelSerializer):
+class PropertySerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Property
         fields = '__all__'
 
 
-class ReadTransactionSerializer(serializers.ModelSerializer):
+class ReadTransactionSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     # file_path = Base64FileField(required=False)
     property = PropertySerializer(read_only=True)
     transferor = PartySerializer(many=True, read_only=True)
@@ -110,7 +118,14 @@ class ReadTransactionSerializer(serializers.ModelSerializer):
             'file_path',
             'notes',
             'is_verified',
+            'stage',
+            'version',
         )
+        expandable = {
+            'property': PropertySerializer,
+            'transferor': PartySerializer,
+            'transferee': PartySerializer,
+        }
 
 
 class WriteTransactionSerializer(serializers.ModelSerializer):
@@ -122,6 +137,8 @@ class WriteTransactionSerializer(serializers.ModelSerializer):
     property = PropertySerializer()
     transferor = PartySerializer(many=True)
     transferee = PartySerializer(many=True)
+    # The version the client last read; updates answer 409 if it is stale
+    version = serializers.IntegerField(required=False)
 
     class Meta:
         model = Transaction
@@ -136,6 +153,7 @@ class WriteTransactionSerializer(serializers.ModelSerializer):
                   'transferor',
                   'file_path',
                   'notes',
+                  'version',
                   )
         read_only_fields = ["id", "created_at", "created_by",]
         # exclude = ['creator_id']
@@ -144,6 +162,7 @@ class WriteTransactionSerializer(serializers.ModelSerializer):
         property_data = validated_data.pop('property', {})
         transferors_data = validated_data.pop('transferor', [])
         transferees_data = validated_data.pop('transferee', [])
+        validated_data.pop('version', None)
 
         with transaction.atomic():
             property_instance, _ = Property.objects.get_or_create(
@@ -162,45 +181,83 @@ class WriteTransactionSerializer(serializers.ModelSerializer):
         return my_transaction
 
     def update(self, instance, validated_data):
-        # Update fields of the Transaction model
-        instance.type = validated_data.get('type', instance.type)
-        instance.form_number = validated_data.get(
-            'form_number', instance.form_number)
-        instance.registration_number = validated_data.get(
-            'registration_number', instance.registration_number)
-        instance.purchase_price = validated_data.get(
-            'purchase_price', instance.purchase_price)
-        instance.received_from = validated_data.get(
-            'received_from', instance.received_from)
-        instance.notes = validated_data.get('notes', instance.notes)
-
-        # Update the Property instance
-        property_data = validated_data.get('property', {})
-        property_instance, _ = Property.objects.get_or_create(**property_data)
-        instance.property = property_instance
-
-        # Update transferors
-        transferors_data = validated_data.get('transferor', [])
-        instance.transferor.clear()
-        for transferor_data in transferors_data:
-            transferor, _ = Party.objects.get_or_create(**transferor_data)
-            instance.transferor.add(transferor)
-
-        # Update transferees
-        transferees_data = validated_data.get('transferee', [])
-        instance.transferee.clear()
-        for transferee_data in transferees_data:
-            transferee, _ = Party.objects.get_or_create(**transferee_data)
-            instance.transferee.add(transferee)
-
-        instance.save()
+        values = {name: validated_data[name] for name in (
+            'type', 'form_number', 'registration_number', 'purchase_price', 'received_from', 'notes',
+        ) if name in validated_data}
+
+        with transaction.atomic():
+            if 'property' in validated_data:
+                values['property'], _ = Property.objects.get_or_create(**validated_data['property'])
+            update_transaction(instance, values, validated_data.get('version'))
+
+            # Replace the parties given; a partial update leaves the others
+            for field in ('transferor', 'transferee'):
+                if field not in validated_data:
+                    continue
+                parties = getattr(instance, field)
+                parties.clear()
+                for party_data in validated_data[field]:
+                    party, _ = Party.objects.get_or_create(**party_data)
+                    parties.add(party)
         return instance
 
 
-class VerifyTransactionSerializer(serializers.ModelSerializer):
+class BulkPartySerializer(PartySerializer):
+    """
+    Party rows for bulk intake. Uniqueness is resolved against the database
+    in one batch by ``users.bulk`` instead of one query per field.
+    """
+    class Meta(PartySerializer.Meta):
+        extra_kwargs = {
+            "id": {"read_only": True},
+            "email": {"validators": []},
+            "phone_number": {"validators": []},
+        }
+
+
+class BulkFlagSerializer(serializers.Serializer):
+    """Sets one stage flag on many transactions, see ``users.transitions.set_flag``."""
+    ids = serializers.ListField(child=serializers.CharField(), allow_empty=False, max_length=500)
+    flag = serializers.ChoiceField(choices=[flag for _, flag in Transaction.STAGE_FLAGS])
+    value = serializers.BooleanField(default=True)
+
+
+class TransactionEventSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = TransactionEvent
+        fields = (
+            'id',
+            'action',
+            'changes',
+            'actor',
+            'created_at',
+        )
+
+
+class BulkTransactionSerializer(WriteTransactionSerializer):
+    """
+    Validates a single row of a bulk intake request without touching the
+    database; see ``users.bulk.bulk_create_transactions``.
+    """
+    transferor = BulkPartySerializer(many=True)
+    transferee = BulkPartySerializer(many=True)
+
+    class Meta(WriteTransactionSerializer.Meta):
+        fields = tuple(
+            field for field in WriteTransactionSerializer.Meta.fields if field not in ('file_path', 'version'))
+        extra_kwargs = {
+            "form_number": {"validators": []},
+            "registration_number": {"validators": []},
+        }
+
+
+class VerifyTransactionSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     property = PropertySerializer(read_only=True)
     transferor = PartySerializer(many=True, read_only=True)
     transferee = PartySerializer(many=True, read_only=True)
+    # The version the client last read; updates answer 409 if it is stale
+    version = serializers.IntegerField(required=False)
 
     class Meta:
         model = Transaction
@@ -217,19 +274,30 @@ class VerifyTransactionSerializer(serializers.ModelSerializer):
             'purchase_price',
             'file_path',
             'is_verified',
+            'stage',
+            'version',
             'notes',
             'created_at',
             'created_by'
         )
+        expandable = {
+            'property': PropertySerializer,
+            'transferor': PartySerializer,
+            'transferee': PartySerializer,
+        }
+
+    def create(self, validated_data):
+        validated_data.pop('version', None)
+        return super().create(validated_data)
 
     def update(self, instance, validated_data):
-        instance.is_verified = validated_data.get(
-            'is_verified', instance.is_verified)
-        instance.save()
-        return instance
+        if 'is_verified' not in validated_data:
+            return instance
+        return update_transaction(
+            instance, {'is_verified': validated_data['is_verified']}, validated_data.get('version'))
 
 
-class TransactionAssignmentSerializer(serializers.ModelSerializer):
+class TransactionAssignmentSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
 
     assigned_person = serializers.ReadOnlyField(
         source='assigned_to.get_full_name',)
@@ -246,17 +314,52 @@ class TransactionAssignmentSerializer(serializers.ModelSerializer):
             'assigned_person',
             'assigned_by'
         )
+        expandable = {'transaction': ReadTransactionSerializer}
+
+
+class WorkItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = WorkItem
+        fields = (
+            'id',
+            'assignment',
+            'transaction',
+            'staff',
+            'department',
+            'slot',
+            'assigned_at',
+        )
+        expandable = {'transaction': ReadTransactionSerializer}
 
 
-class InspectionImageSerializer(serializers.ModelSerializer):
+class InspectionImageSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+    medium = serializers.SerializerMethodField()
 
     class Meta:
         model = InspectionImage
-        fields = ('image',)
+        fields = ('image', 'thumbnail', 'medium')
 
+    def get_rendition_url(self, obj, rendition):
+        # None until the renditions job has run, see users.images
+        if not obj.image or not obj.has_renditions:
+            return None
+        url = default_storage.url(rendition_name(obj.image.name, rendition))
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
 
-class InspectionSerializer(serializers.ModelSerializer):
-    images = InspectionImageSerializer(many=True,)
+    def get_thumbnail(self, obj):
+        return self.get_rendition_url(obj, 'thumbnail')
+
+    def get_medium(self, obj):
+        return self.get_rendition_url(obj, 'medium')
+
+
+class InspectionSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    # Uploaded as multipart files named ``images``, see create()
+    images = InspectionImageSerializer(many=True, read_only=True)
     # document_file = serializers.FileField(required=False, max_length=None,
     #   allow_empty_file=True, use_url=True)
 
@@ -269,6 +372,10 @@ class InspectionSerializer(serializers.ModelSerializer):
             'images',
             'inspected_date',
         )
+        expandable = {
+            'transaction_assigned': TransactionAssignmentSerializer,
+            'images': InspectionImageSerializer,
+        }
 
     def create(self, validated_data):
         # images_data = validated_data.pop('image', [])
@@ -279,11 +386,12 @@ class InspectionSerializer(serializers.ModelSerializer):
 
         if document_data:
             inspection.document_file = document_data
-            inspection.save()
+            inspection.save(update_fields=['document_file'])
 
         for image_data in images_data:
-            InspectionImage.objects.create(
+            image = InspectionImage.objects.create(
                 inspection=inspection, image=image_data)
+            schedule_renditions(image.image.name)
         return inspection
 
     def update(self, instance, validated_data):
@@ -292,11 +400,53 @@ class InspectionSerializer(serializers.ModelSerializer):
         # Update inspection fields
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        instance.save(update_fields=list(validated_data))
 
         # Handle images
         for image_data in images_data:
-            InspectionImage.objects.create(
+            image = InspectionImage.objects.create(
                 inspection=instance, image=image_data)
+            schedule_renditions(image.image.name)
 
         return instance
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ChunkedUpload
+        fields = (
+            'id',
+            'filename',
+            'size',
+            'offset',
+            'target',
+            'target_id',
+            'status',
+            'created_at',
+        )
+        read_only_fields = ['id', 'offset', 'status', 'created_at']
+
+    def validate_filename(self, value):
+        try:
+            return clean_filename(value)
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError('Not a valid file name.')
+
+    def validate_size(self, value):
+        max_size = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', None)
+        if max_size and value > max_size:
+            raise serializers.ValidationError(
+                f'Uploads are limited to {max_size} bytes.')
+        return value
+
+    def validate(self, attrs):
+        model, _ = TARGETS[attrs['target']]
+        try:
+            exists = model.objects.filter(pk=attrs['target_id']).exists()
+        except (ValueError, DjangoValidationError):
+            exists = False
+        if not exists:
+            raise serializers.ValidationError(
+                {'target_id': f'No {attrs["target"]} with this id.'})
+        return attrs
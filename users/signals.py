@@ -0,0 +1,214 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.caching import bump_generation
+from users.dictionaries import bump_version
+from users import events, metrics, stats
+from users.models import (CustomUser, Dictionary, DictionaryItem, Inspection, Party, Property, StaffUser,
+                          Transaction, TransactionAssignment, WorkItem)
+from users.worklists import apply_deltas, item_deltas, sync_assignment, sync_department, sync_transaction
+
+
+@receiver([post_save, post_delete], sender=Dictionary)
+@receiver([post_save, post_delete], sender=DictionaryItem)
+def invalidate_dictionaries(sender, **kwargs):
+    bump_version()
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+@receiver([post_save, post_delete], sender=Property)
+@receiver([post_save, post_delete], sender=Party)
+@receiver([post_save, post_delete], sender=TransactionAssignment)
+def invalidate_responses(sender, **kwargs):
+    bump_generation(sender)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user_responses(sender, update_fields=None, **kwargs):
+    # Parties are also edited as plain users (UserViewSet), which sends
+    # CustomUser's signals rather than Party's; logins only set last_login
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        bump_generation(Party)
+
+
+@receiver(m2m_changed, sender=Transaction.transferor.through)
+@receiver(m2m_changed, sender=Transaction.transferee.through)
+@receiver(m2m_changed, sender=TransactionAssignment.assigned_to_mandatory.through)
+def invalidate_responses_m2m(sender, instance, action, model, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation(type(instance), model)
+
+
+def touch_transactions(**lookups):
+    """Bump ``updated_at`` on transactions whose nested payload changed."""
+    Transaction.objects.filter(Q(**lookups, _connector=Q.OR)).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Party)
+def touch_party_transactions(sender, instance, created, **kwargs):
+    if not created:
+        touch_transactions(transferor=instance, transferee=instance)
+
+
+@receiver(post_save, sender=CustomUser)
+def touch_user_transactions(sender, instance, created, update_fields=None, **kwargs):
+    # A party edited as a plain user, see invalidate_user_responses
+    if not created and (update_fields is None or set(update_fields) - {'last_login'}):
+        touch_transactions(transferor=instance.pk, transferee=instance.pk)
+
+
+@receiver(post_save, sender=Property)
+def touch_property_transaction(sender, instance, created, **kwargs):
+    if not created:
+        touch_transactions(property=instance)
+
+
+@receiver([post_save, post_delete], sender=TransactionAssignment)
+def touch_assigned_transaction(sender, instance, **kwargs):
+    touch_transactions(pk=instance.transaction_id)
+
+
+@receiver(m2m_changed, sender=Transaction.transferor.through)
+@receiver(m2m_changed, sender=Transaction.transferee.through)
+def touch_transaction_parties(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Transaction):
+        touch_transactions(pk=instance.pk)
+    elif pk_set:
+        touch_transactions(pk__in=pk_set)
+
+
+@receiver(m2m_changed, sender=TransactionAssignment.assigned_to_mandatory.through)
+def touch_assignment_staff(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, TransactionAssignment):
+        touch_transactions(pk=instance.transaction_id)
+    elif pk_set:
+        touch_transactions(assignments__pk__in=pk_set)
+
+
+@receiver(post_save, sender=TransactionAssignment)
+def sync_assignment_work_items(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_assignment(instance)
+
+
+@receiver(m2m_changed, sender=TransactionAssignment.assigned_to_mandatory.through)
+def sync_mandatory_work_items(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, TransactionAssignment):
+        sync_assignment(instance)
+        return
+    assignments = TransactionAssignment.objects.select_related('transaction')
+    if pk_set is None:
+        assignments = assignments.filter(
+            work_items__staff=instance, work_items__slot='mandatory')
+    else:
+        assignments = assignments.filter(pk__in=pk_set)
+    for assignment in assignments:
+        sync_assignment(assignment)
+
+
+@receiver(post_save, sender=Transaction)
+def sync_transaction_work_items(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        sync_transaction(instance)
+
+
+@receiver(post_save, sender=StaffUser)
+def sync_staff_work_items(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        sync_department(instance)
+
+
+@receiver(post_delete, sender=WorkItem)
+def uncount_work_item(sender, instance, **kwargs):
+    if instance.is_open:
+        apply_deltas(item_deltas([(instance.staff_id, instance.department)], -1))
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_stats(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._stats_before = stats.snapshot(pk=instance.pk)
+
+
+@receiver(post_save, sender=Transaction)
+def record_transaction_event(sender, instance, created, raw=False, **kwargs):
+    # Runs before update_transaction_stats, which consumes _stats_before
+    if raw:
+        return
+    if created:
+        events.record_many([events.created_event(instance)])
+        return
+    before = instance.__dict__.get('_stats_before')
+    if before and before[0]['stage'] != instance.stage:
+        events.record(instance.pk, 'flag', {'stage': [before[0]['stage'], instance.stage]})
+
+
+@receiver(post_save, sender=Transaction)
+def update_transaction_stats(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        before = [] if created else instance.__dict__.pop('_stats_before', [])
+        stats.apply_change(before, stats.snapshot(pk=instance.pk))
+
+
+@receiver(pre_delete, sender=Transaction)
+def uncount_transaction_stats(sender, instance, **kwargs):
+    # Before the delete, while the property (and its district) still exists
+    stats.apply_change(stats.snapshot(pk=instance.pk), [])
+
+
+@receiver(pre_save, sender=Property)
+def remember_property_district(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._district_before = Property.objects.filter(
+            pk=instance.pk).values_list('district', flat=True).first()
+
+
+@receiver(post_save, sender=Property)
+def move_property_stats(sender, instance, created, raw=False, **kwargs):
+    before = instance.__dict__.pop('_district_before', None)
+    if created or raw or before is None or before == instance.district:
+        return
+    after = stats.snapshot(property=instance)
+    stats.apply_change([dict(row, property__district=before) for row in after], after)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    metrics.instrument(connection)
+
+
+@receiver(post_save, sender=TransactionAssignment)
+def record_assignment_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.record(instance.transaction_id, 'assigned', {
+            'assignment': str(instance.pk), 'optional': instance.assigned_to_optional_id})
+
+
+@receiver(m2m_changed, sender=TransactionAssignment.assigned_to_mandatory.through)
+def record_mandatory_assignment_event(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    event = 'assigned' if action == 'post_add' else 'unassigned'
+    if isinstance(instance, TransactionAssignment):
+        events.record(instance.transaction_id, event, {
+            'assignment': str(instance.pk), 'mandatory': sorted(pk_set)})
+    else:
+        for pk, transaction_id in TransactionAssignment.objects.filter(
+                pk__in=pk_set).values_list('pk', 'transaction_id'):
+            events.record(transaction_id, event, {'assignment': str(pk), 'mandatory': [instance.pk]})
+
+
+@receiver(post_save, sender=Inspection)
+def record_inspection_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.record(instance.transaction_assigned.transaction_id, 'inspected', {
+            'inspection': str(instance.pk), 'assignment': str(instance.transaction_assigned_id)})
@@ -0,0 +1,115 @@
+"""
+Dashboard statistics from pre-aggregated rollups.
+
+Every transaction counts once towards each of the ``StatsRollup`` rows
+named by ``contributions``: its stage, its property's district, its type
+and the month it was received in. There is no row for the overall total,
+which every write would have to lock; ``get_stats`` adds up the district
+rows instead, as each transaction has exactly one. Signals compare a
+transaction's row before and after a save (or a property's district) and
+apply the difference with ``F()`` increments, so the dashboard reads a
+few dozen rows no matter how many transactions there are. ``rebuild``
+recomputes everything from scratch, see ``manage.py rebuild_stats``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from users.models import StatsRollup, Transaction
+
+# The Transaction values() columns a transaction's contributions depend on
+COLUMNS = ('pk', 'stage', 'type', 'purchase_price', 'created_at', 'property__district')
+
+
+def month_key(created_at):
+    return timezone.localtime(created_at).strftime('%Y-%m')
+
+
+def contributions(row):
+    """The ``(dimension, key)`` pairs a transaction ``row`` counts towards."""
+    return (
+        ('stage', row['stage']),
+        ('district', row['property__district']),
+        ('type', row['type']),
+        ('month', month_key(row['created_at'])),
+    )
+
+
+def row_deltas(rows, sign, deltas=None):
+    """Add ``sign`` times each row to ``deltas``: key -> [count, price]."""
+    if deltas is None:
+        deltas = defaultdict(lambda: [0, Decimal(0)])
+    for row in rows:
+        for key in contributions(row):
+            deltas[key][0] += sign
+            deltas[key][1] += sign * (row['purchase_price'] or 0)
+    return deltas
+
+
+def apply_deltas(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    # Make sure every row exists with one INSERT, then increment each
+    StatsRollup.objects.bulk_create([
+        StatsRollup(dimension=dimension, key=key) for dimension, key in deltas
+    ], ignore_conflicts=True)
+    for (dimension, key), (count, price) in deltas.items():
+        StatsRollup.objects.filter(dimension=dimension, key=key).update(
+            transaction_count=F('transaction_count') + count,
+            purchase_price_total=F('purchase_price_total') + price)
+
+
+def snapshot(**lookups):
+    return list(Transaction.objects.filter(**lookups).order_by().values(*COLUMNS))
+
+
+def add_transactions(pks):
+    """Count transactions created without signals, e.g. by ``bulk_create``."""
+    apply_deltas(row_deltas(snapshot(pk__in=pks), 1))
+
+
+def apply_change(before, after):
+    """Move counts from the ``before`` rows to the ``after`` rows."""
+    deltas = row_deltas(before, -1)
+    row_deltas(after, 1, deltas)
+    apply_deltas(deltas)
+
+
+def rebuild():
+    """Recompute every rollup row from the transactions table."""
+    with db_transaction.atomic():
+        rows = Transaction.objects.order_by().values(*COLUMNS).iterator(chunk_size=2000)
+        deltas = row_deltas(rows, 1)
+        StatsRollup.objects.all().delete()
+        StatsRollup.objects.bulk_create([
+            StatsRollup(dimension=dimension, key=key,
+                        transaction_count=count, purchase_price_total=price)
+            for (dimension, key), (count, price) in deltas.items()
+        ])
+    return len(deltas)
+
+
+def format_price(price):
+    return str(Decimal(price).quantize(Decimal('0.01')))
+
+
+def get_stats():
+    """
+    All rollups as ``{dimension: {key: {'count', 'purchase_price'}}}``,
+    plus ``total``, a single ``{'count', 'purchase_price'}``.
+    """
+    stats = {dimension: {} for dimension, _ in StatsRollup.DIMENSION_CHOICES}
+    total_count, total_price = 0, Decimal(0)
+    rows = StatsRollup.objects.filter(transaction_count__gt=0).values_list(
+        'dimension', 'key', 'transaction_count', 'purchase_price_total')
+    for dimension, key, count, price in rows:
+        stats[dimension][key] = {'count': count, 'purchase_price': format_price(price)}
+        if dimension == 'district':
+            total_count += count
+            total_price += price
+    stats['total'] = {'count': total_count, 'purchase_price': format_price(total_price)}
+    return stats
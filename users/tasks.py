@@ -0,0 +1,20 @@
+"""
+Background tasks run through ``users.jobs``. Each must be safe to run
+again after a failed or interrupted attempt.
+"""
+from users import images
+from users.jobs import task
+from users.models import Transaction
+from users.transitions import update_transaction
+
+
+@task('images.renditions', max_attempts=3)
+def generate_renditions(name):
+    images.generate_renditions(name)
+
+
+@task('transactions.valuation_done')
+def mark_valuation_done(transaction_id):
+    transaction = Transaction.objects.filter(pk=transaction_id, is_valuation_done=False).only('pk').first()
+    if transaction is not None:
+        update_transaction(transaction, {'is_valuation_done': True})
@@ -0,0 +1,139 @@
+"""
+Lock-free writes to transactions with optimistic concurrency.
+
+``update_transaction`` writes only the columns it is given, plus the
+stage derived from the flags, with one ``UPDATE`` conditional on the
+row's ``version``, which it bumps. A client that sends the version it
+last read gets a 409 (``VersionConflict``) when someone else wrote the
+row in between. Without one, a write that loses a race is retried
+against the fresh row; since only the changed columns are written, the
+other writer's changes survive either way.
+
+``set_flag`` sets one flag on many transactions with a single ``UPDATE``
+that derives each row's stage in SQL.
+
+Both record a ``TransactionEvent`` per changed transaction (``users.events``).
+
+``update()`` sends no signals, so the stats rollups, work items and
+response cache are brought up to date here.
+
+``Transaction.save()`` checks the version too and raises the model layer's
+``StaleVersion``, which ``exception_handler`` answers like ``VersionConflict``.
+"""
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.views import exception_handler as default_exception_handler
+
+from users import events, stats
+from users.caching import bump_generation
+from users.models import StaleVersion, Transaction, TransactionEvent
+from users.worklists import is_open_stage, sync_stages, sync_transaction
+
+COLUMNS = (*stats.COLUMNS, 'version', *events.FLAGS)
+
+# Writes retried after losing a race when the client sent no version
+ATTEMPTS = 3
+
+
+class VersionConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The transaction was changed by someone else. Reload it and try again.'
+    default_code = 'conflict'
+
+
+def exception_handler(exc, context):
+    """DRF's handler, with ``StaleVersion`` answered as a 409."""
+    if isinstance(exc, StaleVersion):
+        exc = VersionConflict()
+    return default_exception_handler(exc, context)
+
+
+def update_transaction(instance, values, version=None):
+    """
+    Write ``values`` to the row of ``instance`` if it is still at
+    ``version`` (any version if ``None``) and update ``instance`` to match.
+    """
+    for _ in range(ATTEMPTS):
+        with db_transaction.atomic():
+            row = Transaction.objects.filter(pk=instance.pk).order_by().values(*COLUMNS).first()
+            if row is None:
+                raise exceptions.NotFound()
+            if version is not None and row['version'] != version:
+                raise VersionConflict()
+            stage = Transaction.stage_for({**row, **values})
+            now = timezone.now()
+            if Transaction.objects.filter(pk=instance.pk, version=row['version']).update(
+                    **values, stage=stage, version=F('version') + 1, updated_at=now):
+                for name, value in values.items():
+                    setattr(instance, name, value)
+                instance.stage = stage
+                instance.version = row['version'] + 1
+                instance.updated_at = now
+                synchronize(instance, row, values)
+                return instance
+        if version is not None:
+            raise VersionConflict()
+    raise VersionConflict()
+
+
+def synchronize(instance, row, values):
+    """What the ``Transaction`` signal handlers would do after a save."""
+    if 'property' in values:
+        after = stats.snapshot(pk=instance.pk)
+    else:
+        after = [{**row, **{name: value for name, value in values.items() if name in row},
+                  'stage': instance.stage}]
+    stats.apply_change([row], after)
+    if instance.stage != row['stage']:
+        sync_transaction(instance)
+    changes = events.flag_changes(row, {**row, **values, 'stage': instance.stage})
+    if changes:
+        events.record(instance.pk, 'flag', changes)
+    bump_generation(Transaction)
+
+
+def stage_expression(flag, value):
+    """SQL for the stage of a row once ``flag`` is set to ``value``."""
+    whens = []
+    for stage, name in Transaction.STAGE_FLAGS:
+        if name == flag:
+            if not value:
+                return Case(*whens, default=Value(stage))
+        else:
+            whens.append(When(**{name: False}, then=Value(stage)))
+    return Case(*whens, default=Value('completed'))
+
+
+def set_flag(pks, flag, value, actor=None):
+    """
+    Set ``flag`` to ``value`` on the transactions ``pks``. Returns
+    ``{pk: 'updated' | 'unchanged' | 'not_found'}``.
+    """
+    with db_transaction.atomic():
+        rows = list(Transaction.objects.filter(pk__in=pks).select_for_update()
+                    .order_by().values(*COLUMNS))
+        before = [row for row in rows if row[flag] != value]
+        after = [{**row, flag: value, 'stage': Transaction.stage_for({**row, flag: value})}
+                 for row in before]
+        if before:
+            now = timezone.now()
+            Transaction.objects.filter(pk__in=[row['pk'] for row in before]).update(
+                **{flag: value}, stage=stage_expression(flag, value),
+                version=F('version') + 1, updated_at=now)
+            stats.apply_change(before, after)
+            sync_stages({
+                row['pk']: row['stage'] for old, row in zip(before, after)
+                if is_open_stage(old['stage']) != is_open_stage(row['stage'])})
+            events.record_many([
+                TransactionEvent(
+                    transaction_id=row['pk'], actor=actor, action='flag', created_at=now,
+                    changes=events.flag_changes(old, row))
+                for old, row in zip(before, after)])
+            bump_generation(Transaction)
+
+    found = {row['pk'] for row in rows}
+    updated = {row['pk'] for row in before}
+    return {pk: 'updated' if pk in updated else 'unchanged' if pk in found else 'not_found'
+            for pk in pks}
@@ -0,0 +1,133 @@
+"""
+Resumable chunked uploads for transaction and inspection documents.
+
+A client creates an upload, sends the file in pieces with the byte offset
+each piece starts at, and finalizes it with the SHA-256 of the whole file.
+Chunks are streamed from the request to a partial file in fixed size
+blocks, so memory use does not depend on the chunk or file size, and a
+dropped connection only loses the chunk in flight.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import get_valid_filename
+
+from users.models import ChunkedUpload, Inspection, Transaction
+
+BLOCK_SIZE = 64 * 1024
+
+TARGETS = {
+    'transaction': (Transaction, 'file_path'),
+    'inspection': (Inspection, 'document_file'),
+}
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        self.offset = offset
+        super().__init__(f'Upload is at offset {offset}.')
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def clean_filename(name):
+    """
+    The client's file name without any directories, as stored. Raises
+    ``SuspiciousFileOperation`` if nothing usable is left (e.g. ``..``).
+    """
+    return get_valid_filename(os.path.basename(name.replace('\\', '/')))
+
+
+def max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def partial_path(upload):
+    return default_storage.path(upload.partial_name)
+
+
+def get_target(upload, lock=False):
+    model, _ = TARGETS[upload.target]
+    queryset = model.objects.select_for_update() if lock else model.objects
+    return queryset.get(pk=upload.target_id)
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Copy ``length`` bytes from ``stream`` to the partial file at ``offset``.
+    Raises ``OffsetMismatch`` if the chunk does not start where the upload
+    left off, so the client can resume from the returned offset.
+    """
+    if length > max_chunk_size() or offset + length > upload.size:
+        raise UploadTooLarge()
+
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.status != 'uploading' or offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+
+        path = partial_path(upload)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as partial:
+            partial.seek(offset)
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                partial.write(block)
+                written += len(block)
+            # Drop anything left over from an earlier, interrupted attempt.
+            partial.truncate()
+
+        upload.offset = offset + written
+        upload.save(update_fields=['offset'])
+    return upload
+
+
+def checksum(upload):
+    digest = hashlib.sha256()
+    with open(partial_path(upload), 'rb') as partial:
+        for block in iter(lambda: partial.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def reset(upload):
+    """
+    Discard the stored bytes so the client starts over. The row is locked
+    like in ``append_chunk()``, so a chunk being written finishes first.
+    """
+    with transaction.atomic():
+        upload = ChunkedUpload.objects.select_for_update().get(pk=upload.pk)
+        path = partial_path(upload)
+        if os.path.exists(path):
+            os.remove(path)
+        upload.offset = 0
+        upload.save(update_fields=['offset'])
+    return upload
+
+
+def finalize(upload):
+    """
+    Attach the finished file to its target and remove the partial file.
+    Raises ``DoesNotExist`` if the target was deleted during the upload.
+    """
+    _, field_name = TARGETS[upload.target]
+    path = partial_path(upload)
+    with transaction.atomic():
+        target = get_target(upload, lock=True)
+        with open(path, 'rb') as partial:
+            getattr(target, field_name).save(
+                clean_filename(upload.filename), File(partial), save=False)
+        target.save(update_fields=[field_name])
+        upload.status = 'complete'
+        upload.save(update_fields=['status'])
+    os.remove(path)
+    return target
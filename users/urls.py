@@ -20,11 +20,22 @@ router.register(r'inspections', views.InspectionViewSet,
                 basename='inspections')
 router.register(r'properties', views.PropertyViewSet,
                 basename='property')
+router.register(r'uploads', views.ChunkedUploadViewSet,
+                basename='uploads')
+router.register(r'worklist', views.WorklistViewSet,
+                basename='worklist')
 
 
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browserable API.
 urlpatterns = [
+    path('api/exports/<str:resource>.<str:file_format>', views.ExportView.as_view(),
+         name='export'),
+    path('api/dictionaries/<str:code>/', views.DictionaryView.as_view(),
+         name='dictionary'),
+    path('api/stats/', views.StatsView.as_view(), name='stats'),
+    path('api/_metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('api/events/', views.EventScanView.as_view(), name='events'),
     path('api/', include(router.urls)),
     # path('api-auth/', include('rest_framework.urls', namespace='rest_framework'))
     path('change-password/', views.ChangePasswordView.as_view(),
@@ -1,22 +1,127 @@
 # from django.contrib.auth.models import User
+import datetime
+import json
+import os
+import uuid
+
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from rest_framework import viewsets, generics, status, permissions
-from users.models import Party, StaffUser, Transaction, TransactionAssignment, Inspection, Property, InspectionImage
-from users.serializers import InspectionSerializer, TransactionAssignmentSerializer, VerifyTransactionSerializer, WriteTransactionSerializer, UserSerializer, ReadTransactionSerializer, PartySerializer, StaffUserSerializer, PropertySerializer, ChangePasswordSerializer
+from rest_framework import viewsets, generics, mixins, status, permissions
+from users.models import ChunkedUpload, Party, StaffUser, Transaction, TransactionAssignment, Inspection, Property, InspectionImage, WorkItem
+from users.serializers import BulkFlagSerializer, BulkTransactionSerializer, TransactionEventSerializer, ChunkedUploadSerializer, InspectionSerializer, TransactionAssignmentSerializer, VerifyTransactionSerializer, WriteTransactionSerializer, UserSerializer, ReadTransactionSerializer, PartySerializer, StaffUserSerializer, PropertySerializer, ChangePasswordSerializer, WorkItemSerializer
 
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, SuspiciousFileOperation
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.contrib.auth import get_user_model
 from rest_framework.parsers import MultiPartParser, FormParser, FileUploadParser
-from rest_framework.exceptions import MethodNotAllowed
-
-from users.permissions import CanUpdateField, ReadOnlyOrPartialUpdatePermission, UserPermission
+from rest_framework.exceptions import MethodNotAllowed, NotFound, ValidationError
+from rest_framework.settings import api_settings
+
+from users.bulk import bulk_create_transactions
+from users.exports import CONTENT_TYPES, EXPORTS, stream_export
+from users import events
+from users import jobs, uploads
+from users.dictionaries import get_dictionary
+from users.caching import CachedResponseMixin, ConditionalGetMixin
+from users.fastpath import UnsupportedField, ValuesPlan, values_queryset
+from users.fieldsets import narrow_queryset, parse_paths
+from users.metrics import MetricsMixin, collect
+from users.pagination import CountedKeysetPagination, KeysetPagination
+from users.stats import get_stats
+from users.search import search_parties, search_properties, search_transactions
+from users.transitions import set_flag
+from users.worklists import get_count
+from users.permissions import (CanUpdateField, IsCoordinator, ReadOnlyOrPartialUpdatePermission,
+                               UserPermission)
 
 from rest_framework.response import Response
 from rest_framework.decorators import action
 
+
 User = get_user_model()
 
+SEARCH_MAX_RESULTS = 100
+
+
+class SearchMixin:
+    """
+    Adds ``GET <list>/search/?q=...&limit=...`` returning the best matches
+    from ``search_function`` in rank order.
+    """
+    search_function = None
+
+    @action(detail=False, methods=['get', ], url_path=r'search')
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get(
+                'limit', settings.REST_FRAMEWORK['PAGE_SIZE'])), SEARCH_MAX_RESULTS)
+        except ValueError:
+            limit = settings.REST_FRAMEWORK['PAGE_SIZE']
+        pks = self.search_function(query, limit) if query else []
+        found = self.get_queryset().in_bulk(pks)
+        results = [found[pk] for pk in pks if pk in found]
+        serializer = self.get_serializer(results, many=True)
+        return Response(serializer.data)
+
+
+class FieldsetMixin:
+    """
+    Honours ``?fields=`` and ``?expand=`` on read actions (see
+    ``users.fieldsets``): the serializer renders only what was asked for
+    and the queryset loads only that, so unrequested relations cost no
+    queries and nested data is never fetched row by row.
+    """
+    read_actions = ('list', 'retrieve', 'un_verified', 'queue', 'search')
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.read_actions:
+            params = self.request.query_params
+            kwargs.setdefault('fields', parse_paths(params.get('fields')))
+            kwargs.setdefault('expand', parse_paths(params.get('expand')))
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.read_actions:
+            return narrow_queryset(queryset, self.get_serializer())
+        return queryset
+
+
+class ValuesListMixin:
+    """
+    Serves ``list`` from ``values()`` rows through ``users.fastpath``, with
+    output identical to the serializer's but no serializer or model
+    instance per row. Opt-in: with ``?fast=1``, or for every list request
+    with the ``VALUES_LISTS`` setting (``?fast=0`` then opts out). Falls
+    back to the serializer when it has a field the fast path cannot read.
+    """
+    values_list_param = 'fast'
+
+    def use_values_list(self, request):
+        value = request.query_params.get(self.values_list_param)
+        if value is None:
+            return getattr(settings, 'VALUES_LISTS', False)
+        return value.lower() in ('1', 'true', 'yes', 'on')
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_values_list(request):
+            return super().list(request, *args, **kwargs)
+        try:
+            plan = ValuesPlan(self.get_serializer())
+        except UnsupportedField:
+            return super().list(request, *args, **kwargs)
+
+        rows = values_queryset(self.filter_queryset(self.get_queryset()), plan)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.represent_many(page))
+        return Response(plan.represent_many(rows))
+
 
 class UserViewSet(viewsets.ModelViewSet):
     """
@@ -46,13 +151,112 @@ class ChangePasswordView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ExportView(APIView):
+    """
+    Streams properties, transactions or inspections as CSV or NDJSON.
+    Accepts ``district``, ``created_from``/``created_to`` (YYYY-MM-DD) and
+    status flag (``is_verified=true`` ...) query parameters.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, resource, file_format, *args, **kwargs):
+        if resource not in EXPORTS or file_format not in CONTENT_TYPES:
+            raise NotFound()
+        export = EXPORTS[resource]().filter(request.query_params)
+        return stream_export(export, file_format, filename=resource)
+
+
+class DictionaryView(APIView):
+    """
+    A dictionary and its nested items, served from cache. Responses carry an
+    ETag derived from the dictionary version so clients can revalidate.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, code, *args, **kwargs):
+        version, tree = get_dictionary(code)
+        if tree is None:
+            raise NotFound()
+        etag = f'"dictionary-{code}-{version}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({
+                'code': tree.code,
+                'name_en': tree.name_en,
+                'name_sw': tree.name_sw,
+                'items': [item.to_dict() for item in tree.children],
+            })
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class StatsView(APIView):
+    """
+    Transaction counts and purchase price totals overall and per stage,
+    district, type and month (``YYYY-MM``), read from ``StatsRollup``.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_stats())
+
+
+class EventScanView(APIView):
+    """
+    Streams the transaction events created from ``since`` up to ``until``
+    (ISO dates or datetimes) as NDJSON, optionally only some ``action``s.
+    ``created_at`` is formatted as in the timeline.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def parse_time(self, name, required=False):
+        value = self.request.query_params.get(name)
+        if not value:
+            if required:
+                raise ValidationError({name: 'This parameter is required.'})
+            return None
+        try:
+            moment = parse_datetime(value)
+            if moment is None:
+                day = parse_date(value)
+                moment = day and datetime.datetime.combine(day, datetime.time())
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({name: 'Expected an ISO date or datetime.'})
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+    def get(self, request, *args, **kwargs):
+        rows = events.scan(self.parse_time('since', required=True), self.parse_time('until'),
+                           request.query_params.getlist('action'))
+        created_at = TransactionEventSerializer().fields['created_at'].to_representation
+        lines = (json.dumps({**row, 'created_at': created_at(row['created_at'])}, cls=DjangoJSONEncoder) + '\n'
+                 for row in rows)
+        return StreamingHttpResponse(lines, content_type=CONTENT_TYPES['ndjson'])
+
+
+class MetricsView(APIView):
+    """
+    Request counts, means and latency and query count histograms per
+    route, merged across worker processes (``users.metrics``).
+    """
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(collect())
+
+
 # class ChangePasswordView(generics.UpdateAPIView):
 #     queryset = User.objects.all()
 #     serializer_class = ChangePasswordSerializer
 #     # permission_classes = []
 
-class CustomerUserViewSet(viewsets.ModelViewSet):
+class CustomerUserViewSet(MetricsMixin, CachedResponseMixin, SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Party.objects.all()
+    cache_models = (Party,)
+    search_function = staticmethod(search_parties)
     serializer_class = PartySerializer
     # permission_classes = [IsParty]
     permission_classes = [permissions.IsAuthenticated]
@@ -65,8 +269,10 @@ class StaffUserViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class PropertyViewSet(viewsets.ModelViewSet):
+class PropertyViewSet(MetricsMixin, ConditionalGetMixin, CachedResponseMixin, SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Property.objects.all()
+    cache_models = (Property,)
+    search_function = staticmethod(search_properties)
     serializer_class = PropertySerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -74,19 +280,26 @@ class PropertyViewSet(viewsets.ModelViewSet):
     #     serializer.save(created_by=self.request.user)
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(MetricsMixin, ConditionalGetMixin, CachedResponseMixin, SearchMixin, FieldsetMixin, ValuesListMixin, viewsets.ModelViewSet):
     """ 
     View for managing property transaction
     """
     queryset = Transaction.objects.all()
+    cache_models = (Transaction, Property, Party)
+    search_function = staticmethod(search_transactions)
     # serializer_class = TransactionWriteSerializer # I now use get_serializer_class
     # parser_classes = (MultiPartParser, FormParser)
     permission_classes = [permissions.IsAuthenticated]
     http_method_names = ['get', 'post', 'patch', 'put', 'delete']
+    bulk_max_rows = 500
 
     def get_serializer_class(self):
+        if self.action == 'bulk':
+            return BulkTransactionSerializer
         if self.action in ["create", "update", "partial_update", "destroy"]:
             return WriteTransactionSerializer
+        if self.action == 'un_verified':
+            return VerifyTransactionSerializer
         return ReadTransactionSerializer
 
     def create(self, request, *args, **kwargs):
@@ -100,12 +313,101 @@ class TransactionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    @action(detail=False, methods=['post', ], url_path=r'bulk')
+    def bulk(self, request):
+        """
+        Create many transactions in one request. Every row is validated on its
+        own and reported back by index; valid rows are written in batches.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a list of transactions.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.bulk_max_rows:
+            return Response({'error': f'At most {self.bulk_max_rows} transactions per request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = {}
+        valid = []
+        for index, row in enumerate(rows):
+            serializer = BulkTransactionSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': 'error',
+                                  'errors': serializer.errors}
+
+        created_by_id = request.user.pk if StaffUser.objects.filter(
+            pk=request.user.pk).exists() else None
+        for index, instance, errors in bulk_create_transactions(valid, created_by_id):
+            if errors:
+                results[index] = {'index': index,
+                                  'status': 'error', 'errors': errors}
+            else:
+                results[index] = {'index': index,
+                                  'status': 'created', 'id': instance.pk}
+
+        failed = sum(1 for result in results.values()
+                     if result['status'] == 'error')
+        data = {
+            'created': len(rows) - failed,
+            'failed': failed,
+            'results': [results[index] for index in sorted(results)],
+        }
+        return Response(data, status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post', ], url_path=r'bulk-flag', permission_classes=[IsCoordinator])
+    def bulk_flag(self, request):
+        """
+        Set one stage flag, e.g. ``is_verified``, on up to 500 transactions
+        with a single UPDATE. Reports each ID as updated, unchanged,
+        not_found or invalid. Staff and the Coordination Unit only.
+        """
+        serializer = BulkFlagSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        pks = {}
+        for value in ids:
+            try:
+                pks[value] = uuid.UUID(value)
+            except ValueError:
+                pass
+        outcome = set_flag(list(dict.fromkeys(pks.values())), serializer.validated_data['flag'],
+                           serializer.validated_data['value'], actor=request.user)
+        results = {value: outcome[pks[value]] if value in pks else 'invalid' for value in ids}
+        return Response({
+            'updated': sum(1 for result in outcome.values() if result == 'updated'),
+            'results': results,
+        })
+
+    @action(detail=True, methods=['get', ], url_path=r'timeline')
+    def timeline(self, request, pk=None):
+        """The transaction's events, oldest first, in keyset pages."""
+        transaction = self.get_object()
+        paginator = KeysetPagination(api_settings.PAGE_SIZE)
+        page = paginator.paginate_queryset(events.timeline(transaction.pk), request, view=self)
+        return paginator.get_paginated_response(TransactionEventSerializer(page, many=True).data)
+
+    @action(detail=False, methods=['get', ], url_path=r'queue/(?P<stage>[a-z_]+)')
+    def queue(self, request, stage=None):
+        """
+        Worklist for one pipeline stage, served from the (stage, created_at)
+        index.
+        """
+        if stage not in dict(Transaction.STAGE_CHOICES):
+            raise NotFound(f'Unknown stage "{stage}".')
+        queryset = self.get_queryset().filter(stage=stage)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
     # coordinator's view
     # TODO:Find a better way to handle this
     @action(detail=False, methods=['get', ], url_path=r'un-verified')
     def un_verified(self, request):
-        unverified = self.queryset.filter(is_verified=False)
-        serializer = VerifyTransactionSerializer(unverified, many=True)
+        unverified = self.get_queryset().filter(is_verified=False)
+        serializer = self.get_serializer(unverified, many=True)
         return Response(serializer.data)
 
     @action(detail=True, methods=['patch'], url_path=r'toggle-verified')
@@ -113,14 +415,15 @@ class TransactionViewSet(viewsets.ModelViewSet):
         transaction = self.get_object()
 
         if 'is_verified' in request.data:
-            transaction.is_verified = request.data['is_verified']
-            transaction.save()
-            serializer = VerifyTransactionSerializer(transaction)
+            serializer = VerifyTransactionSerializer(
+                transaction, data=request.data, partial=True, context=self.get_serializer_context())
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response({'error': 'Invalid data for partial update.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TransactionVerificationViewSet(viewsets.ModelViewSet):
+class TransactionVerificationViewSet(MetricsMixin, FieldsetMixin, viewsets.ModelViewSet):
     """ 
     View for ES to approve transactions 
     """
@@ -144,7 +447,7 @@ class TransactionVerificationViewSet(viewsets.ModelViewSet):
     #     return Response(self.get_serializer(instance).data)
 
 
-class TransactionAssignmentViewSet(viewsets.ModelViewSet):
+class TransactionAssignmentViewSet(MetricsMixin, FieldsetMixin, viewsets.ModelViewSet):
     queryset = TransactionAssignment.objects.all().filter(transaction__is_verified=True)
     serializer_class = TransactionAssignmentSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -155,7 +458,7 @@ class TransactionAssignmentViewSet(viewsets.ModelViewSet):
     #     serializer.save(creator=self.request.user)
 
 
-class InspectionViewSet(viewsets.ModelViewSet):
+class InspectionViewSet(MetricsMixin, FieldsetMixin, viewsets.ModelViewSet):
     queryset = Inspection.objects.all()
     serializer_class = InspectionSerializer
     # parser_classes = (MultiPartParser, FormParser, FileUploadParser)
@@ -163,10 +466,10 @@ class InspectionViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         inspection = serializer.save()
-        transaction = inspection.transaction_assigned.transaction
-        if transaction:
-            transaction.is_valuation_done = True
-            transaction.save()
+        transaction_id = inspection.transaction_assigned.transaction_id
+        if transaction_id:
+            jobs.enqueue('transactions.valuation_done', {'transaction_id': str(transaction_id)},
+                         key=f'valuation-done:{inspection.pk}')
 
     # def create(self, request, *args, **kwargs):
     #     item_serializer = self.get_serializer(data=request.data)
@@ -190,16 +493,117 @@ class InspectionViewSet(viewsets.ModelViewSet):
     #     return Response(item_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class UserAssignedTransactionsViewSet(viewsets.ModelViewSet):
+class UserAssignedTransactionsViewSet(MetricsMixin, FieldsetMixin, viewsets.ModelViewSet):
+    queryset = TransactionAssignment.objects.all()
     serializer_class = TransactionAssignmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        # Filter TransactionAssignment instances by the 'assigned_to' field
-        # Current authenticated user (StaffUser)
-        return TransactionAssignment.objects.filter(assigned_to=self.request.user)
+        # Assignments where the current user holds a mandatory or the
+        # optional slot, one row each thanks to the work item table
+        return super().get_queryset().filter(
+            work_items__staff_id=self.request.user.pk).order_by('-created_at')
 
     # Override the destroy method to exclude DELETE
     def destroy(self, request, *args, **kwargs):
         raise MethodNotAllowed(
             "DELETE method is not allowed for this resource.")
+
+
+class WorklistViewSet(MetricsMixin, FieldsetMixin, viewsets.GenericViewSet):
+    """
+    Open work for the current staff member and for their department,
+    newest assignment first. Counts come from the maintained
+    ``WorklistCounter`` rows instead of ``COUNT(*)``.
+    """
+    queryset = WorkItem.objects.filter(is_open=True)
+    serializer_class = WorkItemSerializer
+    pagination_class = CountedKeysetPagination
+    permission_classes = [permissions.IsAuthenticated]
+    read_actions = ('list', 'department')
+
+    def paginated_response(self, queryset, count):
+        self.paginator.count = count
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def list(self, request):
+        queryset = self.get_queryset().filter(staff_id=request.user.pk)
+        return self.paginated_response(queryset, get_count('staff', request.user.pk))
+
+    @action(detail=False, methods=['get', ], url_path=r'department')
+    def department(self, request):
+        """Superusers may pick another department with ``?department=``."""
+        department = StaffUser.objects.filter(
+            pk=request.user.pk).values_list('department', flat=True).first()
+        if request.user.is_superuser:
+            department = request.query_params.get('department', department)
+        if department is None:
+            raise NotFound('Only staff members have a department worklist.')
+        queryset = self.get_queryset().filter(department=department)
+        return self.paginated_response(queryset, get_count('department', department))
+
+
+class ChunkedUploadViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable uploads of transaction and inspection documents.
+
+    1. ``POST /api/uploads/`` with filename, size, target and target_id.
+    2. ``PUT /api/uploads/<id>/chunk/`` with the raw bytes and an
+       ``Upload-Offset`` header, repeated until the offset reaches size.
+       ``GET /api/uploads/<id>/`` returns the offset to resume from.
+    3. ``POST /api/uploads/<id>/finalize/`` with the file's ``sha256``.
+    """
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(created_by=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    def perform_destroy(self, instance):
+        path = uploads.partial_path(instance)
+        instance.delete()
+        if os.path.exists(path):
+            os.remove(path)
+
+    @action(detail=True, methods=['put'], url_path=r'chunk')
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'error': 'Upload-Offset and Content-Length headers are required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            upload = uploads.append_chunk(
+                upload, offset, request.stream, length)
+        except uploads.OffsetMismatch as exc:
+            return Response({'error': str(exc), 'offset': exc.offset}, status=status.HTTP_409_CONFLICT)
+        except uploads.UploadTooLarge:
+            return Response({'error': 'Chunk exceeds the upload or chunk size limit.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return Response(self.get_serializer(upload).data)
+
+    @action(detail=True, methods=['post'], url_path=r'finalize')
+    def finalize(self, request, pk=None):
+        upload = self.get_object()
+        if upload.status != 'uploading' or upload.offset != upload.size:
+            return Response({'error': 'Upload is not complete.', 'offset': upload.offset}, status=status.HTTP_409_CONFLICT)
+        if uploads.checksum(upload) != request.data.get('sha256', '').lower():
+            # The stored bytes are corrupt; make the client start over.
+            uploads.reset(upload)
+            return Response({'error': 'Checksum mismatch.', 'offset': 0}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            uploads.finalize(upload)
+        except ObjectDoesNotExist:
+            return Response({'error': f'The {upload.target} was deleted.'}, status=status.HTTP_404_NOT_FOUND)
+        except SuspiciousFileOperation:
+            return Response({'error': 'Not a valid file name.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(upload).data)
@@ -0,0 +1,120 @@
+"""
+Worklists of open assignments per staff member and per department.
+
+Every (assignment, staff member) pair, whether through the mandatory M2M
+or the optional foreign key, is a ``WorkItem`` row carrying the staff
+member's department and whether the transaction is still open. Signals
+call the ``sync_*`` functions below to keep those rows current, and every
+change to the set of open items is applied to ``WorklistCounter`` with
+``F()`` increments, so counts are read from a single row instead of a
+``COUNT(*)``.
+"""
+from collections import Counter
+
+from django.db import transaction as db_transaction
+from django.db.models import F
+
+from users.models import StaffUser, WorkItem, WorklistCounter
+
+
+def is_open_stage(stage):
+    """Whether a transaction at ``stage`` still belongs on worklists."""
+    return stage != 'completed'
+
+
+def is_open(transaction):
+    return is_open_stage(transaction.stage)
+
+
+def item_deltas(items, sign):
+    """Counter deltas for open ``(staff_id, department)`` pairs."""
+    deltas = Counter()
+    for staff_id, department in items:
+        deltas['staff', str(staff_id)] += sign
+        deltas['department', department] += sign
+    return deltas
+
+
+def apply_deltas(deltas):
+    for (scope, key), delta in deltas.items():
+        if not delta:
+            continue
+        WorklistCounter.objects.get_or_create(scope=scope, key=key)
+        WorklistCounter.objects.filter(scope=scope, key=key).update(
+            open_count=F('open_count') + delta)
+
+
+def get_count(scope, key):
+    count = WorklistCounter.objects.filter(
+        scope=scope, key=str(key)).values_list('open_count', flat=True).first()
+    return count or 0
+
+
+def sync_assignment(assignment):
+    """Create, update and delete the work items of one assignment."""
+    slots = {pk: 'optional' for pk in [assignment.assigned_to_optional_id] if pk}
+    slots.update((pk, 'mandatory') for pk in assignment.assigned_to_mandatory.values_list('pk', flat=True))
+    departments = dict(StaffUser.objects.filter(
+        pk__in=slots).values_list('pk', 'department'))
+
+    with db_transaction.atomic():
+        existing = {}
+        stale = []
+        for item in WorkItem.objects.filter(assignment=assignment).select_for_update():
+            if item.staff_id in slots and item.transaction_id == assignment.transaction_id:
+                existing[item.staff_id] = item
+            else:
+                stale.append(item.pk)
+        if stale:
+            # post_delete takes the deleted items off the counters
+            WorkItem.objects.filter(pk__in=stale).delete()
+
+        for staff_id, item in existing.items():
+            if item.slot != slots[staff_id]:
+                item.slot = slots[staff_id]
+                item.save(update_fields=['slot'])
+
+        open_ = is_open(assignment.transaction)
+        created = WorkItem.objects.bulk_create([
+            WorkItem(assignment=assignment, transaction_id=assignment.transaction_id,
+                     staff_id=staff_id, department=departments[staff_id], slot=slot,
+                     is_open=open_, assigned_at=assignment.created_at)
+            for staff_id, slot in slots.items() if staff_id not in existing
+        ])
+        if open_:
+            apply_deltas(item_deltas(
+                [(item.staff_id, item.department) for item in created], 1))
+
+
+def sync_transaction(transaction):
+    """Open or close the work items of a transaction as its stage changes."""
+    sync_stages({transaction.pk: transaction.stage})
+
+
+def sync_stages(stages):
+    """``sync_transaction`` for many transactions, given as ``{pk: stage}``."""
+    for open_ in (True, False):
+        pks = [pk for pk, stage in stages.items() if is_open_stage(stage) == open_]
+        if not pks:
+            continue
+        with db_transaction.atomic():
+            changed = WorkItem.objects.filter(
+                transaction__in=pks, is_open=not open_).select_for_update()
+            items = list(changed.values_list('staff_id', 'department'))
+            if items:
+                changed.update(is_open=open_)
+                apply_deltas(item_deltas(items, 1 if open_ else -1))
+
+
+def sync_department(staff):
+    """Move a staff member's work items after a change of department."""
+    with db_transaction.atomic():
+        moved = WorkItem.objects.filter(staff=staff).exclude(
+            department=staff.department).select_for_update()
+        departments = list(moved.filter(is_open=True).values_list('department', flat=True))
+        if moved.update(department=staff.department):
+            deltas = Counter()
+            for department in departments:
+                deltas['department', department] -= 1
+                deltas['department', staff.department] += 1
+            apply_deltas(deltas)